@@ -1,31 +1,152 @@
 """
-AI Analysis module using Venice AI API with automatic regulation category detection
+AI analysis of regulatory updates with automatic regulation category detection; completions go through llm_backends
 """
 
 import os
-import requests
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import re
+from cache import DiskCache
+from keyword_matcher import KeywordMatcher
+from dedup import cluster_texts
+from relevance import RelevanceScorer, RELEVANCE_THRESHOLD, ANALYSIS_TOP_K
+from documents import DOCUMENT_PROMPT_CHARS, excerpt
+from llm_backends import LLMRouter
+from metrics import ANALYSIS_CACHE, ANALYSIS_ERRORS, BATCH_ITEMS, LLM_SECONDS, LLM_TOKENS
 
 load_dotenv()
 
-class ComplianceAnalyzer:
-    def __init__(self):
-        self.api_key = os.getenv('VENICE_API_KEY')
-        self.api_url = "https://api.venice.ai/api/v1/chat/completions"
-        
-        # Category detection keywords
-        self.category_keywords = {
-            "BSA": ["bank secrecy act", "bsa", "31 cfr", "title 31"],
-            "PATRIOT": ["patriot act", "usa patriot", "title iii"],
-            "CDD": ["customer due diligence", "cdd", "beneficial ownership"],
-            "CIP": ["customer identification", "cip", "customer verification", "identity verification"],
-            "SAR": ["suspicious activity report", "sar", "suspicious transaction"],
-            "CTR": ["currency transaction report", "ctr", "cash transaction", "$10,000"],
-            "RECORDKEEPING": ["recordkeeping", "record retention", "record keeping"],
-            "SANCTIONS": ["sanctions", "ofac", "sdn", "specially designated", "blocked property"],
-            "DIGITAL_ASSETS": ["cryptocurrency", "crypto", "digital asset", "virtual currency", "bitcoin", "blockchain"]
+# Bump whenever system_prompt or the user prompt template changes so stale analyses are not reused
+PROMPT_VERSION = "1"
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '5000'))
+ANALYSIS_CACHE_MAX_AGE_DAYS = float(os.getenv('ANALYSIS_CACHE_MAX_AGE_DAYS', '90'))
+
+# Concurrent analysis requests; endpoints, models and rate limits are in llm_backends
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '4'))
+
+# Uncached updates are packed into one JSON-schema request, up to this many per batch and this
+# many estimated tokens (prompt plus completion budget); ANALYSIS_BATCH_SIZE=1 disables batching
+ANALYSIS_BATCH_SIZE = int(os.getenv('ANALYSIS_BATCH_SIZE', '5'))
+ANALYSIS_BATCH_TOKENS = int(os.getenv('ANALYSIS_BATCH_TOKENS', '8000'))
+BATCH_COMPLETION_TOKENS_PER_ITEM = 700
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analyses": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "summary": {"type": "string"},
+                    "compliance_areas": {"type": "array", "items": {"type": "string"}},
+                    "impacts": {"type": "array", "items": {"type": "string"}},
+                    "recommendations": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["id", "summary", "compliance_areas", "impacts", "recommendations"],
+                "additionalProperties": False
+            }
         }
+    },
+    "required": ["analyses"],
+    "additionalProperties": False
+}
+
+# Category detection keywords
+CATEGORY_KEYWORDS = {
+    "BSA": ["bank secrecy act", "bsa", "31 cfr", "title 31"],
+    "PATRIOT": ["patriot act", "usa patriot", "title iii"],
+    "CDD": ["customer due diligence", "cdd", "beneficial ownership"],
+    "CIP": ["customer identification", "cip", "customer verification", "identity verification"],
+    "SAR": ["suspicious activity report", "sar", "suspicious transaction"],
+    "CTR": ["currency transaction report", "ctr", "cash transaction", "$10,000"],
+    "RECORDKEEPING": ["recordkeeping", "record retention", "record keeping"],
+    "SANCTIONS": ["sanctions", "ofac", "sdn", "specially designated", "blocked property"],
+    "DIGITAL_ASSETS": ["cryptocurrency", "crypto", "digital asset", "virtual currency", "bitcoin", "blockchain"]
+}
+
+BATCH_PROMPT = """Analyze each of the following {count} regulatory updates independently.
+
+{items}
+For every item return one entry in "analyses" with:
+- id: the item's ID exactly as given
+- summary: 2-3 sentences describing exactly what the update changes or announces. Be factual and specific. Cite regulation numbers/sections if mentioned.
+- compliance_areas: which of these areas are directly affected: BSA, PATRIOT Act, CDD/KYC, CIP, SAR Filing, CTR Reporting, Recordkeeping, OFAC Sanctions, Digital Assets
+- impacts: 3-5 specific, measurable impacts on large financial institutions, each naming the affected compliance requirement and BSA/AML program area
+- recommendations: 3-5 concrete, implementable steps large institutions should take, each tied directly to the regulatory change
+
+Remember: Facts only. No speculation. Reference specific BSA/AML requirements."""
+
+
+def format_analysis(entry):
+    """Render a structured analysis in the same section layout as single-update analyses"""
+    impacts = '\n'.join(f"- {line}" for line in entry['impacts'])
+    recommendations = '\n'.join(f"- {line}" for line in entry['recommendations'])
+    return (
+        f"REGULATORY SUMMARY:\n{entry['summary'].strip()}\n\n"
+        f"APPLICABLE COMPLIANCE AREAS:\n{', '.join(entry['compliance_areas'])}\n\n"
+        f"COMPLIANCE IMPACTS FOR LARGE FINANCIAL INSTITUTIONS:\n{impacts}\n\n"
+        f"ACTIONABLE RECOMMENDATIONS:\n{recommendations}"
+    )
+
+
+def parse_batch_response(content, expected_ids):
+    """
+    Structured analyses ({"summary", "compliance_areas", "impacts", "recommendations"}) by id from a
+    batch completion; malformed or unexpected entries are dropped
+    """
+    # Tolerate providers that ignore response_format and wrap the JSON in prose or code fences
+    start, end = content.find('{'), content.rfind('}')
+    try:
+        entries = json.loads(content[start:end + 1])['analyses']
+    except (ValueError, KeyError, TypeError):
+        return {}
+    if not isinstance(entries, list):
+        return {}
+    
+    analyses = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or str(entry.get('id')) not in expected_ids:
+            continue
+        if not isinstance(entry.get('summary'), str) or not entry['summary'].strip():
+            continue
+        fields = [entry.get(name) for name in ('compliance_areas', 'impacts', 'recommendations')]
+        if not all(isinstance(value, list) and all(isinstance(v, str) for v in value) for value in fields):
+            continue
+        analyses[str(entry['id'])] = {
+            'summary': entry['summary'].strip(),
+            'compliance_areas': entry['compliance_areas'],
+            'impacts': entry['impacts'],
+            'recommendations': entry['recommendations']
+        }
+    return analyses
+
+# Compiled once per process and shared by every analyzer
+CATEGORY_MATCHER = KeywordMatcher(CATEGORY_KEYWORDS)
+RELEVANCE_SCORER = RelevanceScorer(CATEGORY_KEYWORDS)
+
+class ComplianceAnalyzer:
+    def __init__(self, analysis_cache=None, max_workers=ANALYSIS_WORKERS, document_fetcher=None, router=None):
+        self.max_workers = max(1, max_workers)
+        
+        # Backend and model per item; each endpoint keeps one keep-alive pool shared by all workers
+        self.router = router if router is not None else LLMRouter(max_connections=self.max_workers)
+        self.model = self.router.default.model
+        
+        # Completed analyses keyed by content hash, so unchanged items never hit the LLM twice
+        if analysis_cache is None:
+            analysis_cache = DiskCache('analyses',
+                                       max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+                                       max_age=ANALYSIS_CACHE_MAX_AGE_DAYS * 86400,
+                                       autosave=False)
+        self.analysis_cache = analysis_cache
+        # Optional DocumentFetcher; when set, analyzed items include an excerpt of the linked document
+        self.document_fetcher = document_fetcher
+        
+        self.category_keywords = CATEGORY_KEYWORDS
         
         self.system_prompt = """You are an expert AML/BSA Compliance Officer with 20+ years of experience advising large financial institutions like Morgan Stanley, JP Morgan Chase, and Bank of America.
 
@@ -59,32 +180,89 @@ Rules:
     
     def detect_categories(self, text):
         """Detect relevant regulation categories from text"""
-        detected = []
-        text_lower = text.lower()
-        
-        for category, keywords in self.category_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    if category not in detected:
-                        detected.append(category)
-                    break
-        
+        detected = CATEGORY_MATCHER.matched_labels(text)
         return detected if detected else ["GENERAL"]
     
-    def analyze_update(self, update_text, regulator_name, regulation_type):
-        """Analyze a regulatory update using AI"""
-        
+    def find_keywords(self, text):
+        """All category keyword matches in text as (keyword, categories, start, end)"""
+        return list(CATEGORY_MATCHER.finditer(text))
+    
+    def cache_key(self, update_text, document=None, model=None):
+        """Content hash identifying an update (and any document excerpt) under a model (default: the default route's) and the prompt"""
+        fields = [
+            update_text.get('title', ''),
+            update_text.get('summary', ''),
+            update_text.get('link', ''),
+            model or self.model,
+            PROMPT_VERSION
+        ]
+        if document:
+            fields.append(hashlib.sha256(document.encode('utf-8')).hexdigest())
+        material = json.dumps(fields)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def _record_usage(self, payload, completion, usage):
+        """Count tokens used, estimating at ~4 characters per token when the API reports none"""
+        if usage and usage.get('prompt_tokens') is not None:
+            prompt_tokens = usage['prompt_tokens']
+            completion_tokens = usage.get('completion_tokens', 0)
+        else:
+            prompt_tokens = sum(len(m['content']) for m in payload['messages']) // 4
+            completion_tokens = len(completion) // 4
+        LLM_TOKENS.inc(prompt_tokens, kind='prompt')
+        LLM_TOKENS.inc(completion_tokens, kind='completion')
+    
+    def analyze_update(self, update_text, regulator_name, regulation_type, on_token=None, document=None):
+        """
+        Analyze a regulatory update using AI, optionally streaming analysis text to on_token.
+        document is an excerpt of the linked document body to include in the prompt; living-document
+        changes (see snapshots.py) default to their "diff" instead.
+        """
+        if document is None:
+            document = update_text.get('diff')
+
         # Detect categories from title and summary
         full_text = f"{update_text.get('title', '')} {update_text.get('summary', '')}"
         detected_categories = self.detect_categories(full_text)
         
+        model = self.router.route(regulator_name, detected_categories).model
+        cached_analysis = self.analysis_cache.get(self.cache_key(update_text, document, model))
+        if cached_analysis is not None:
+            ANALYSIS_CACHE.inc(result='hit')
+            result = {
+                'update': update_text,
+                'analysis': cached_analysis,
+                'regulator': regulator_name,
+                'regulation_type': regulation_type,
+                'categories': detected_categories
+            }
+            # Batched analyses are cached with their structured fields
+            if isinstance(cached_analysis, dict):
+                result['analysis'] = cached_analysis['analysis']
+                result['structured'] = cached_analysis['structured']
+            return result
+        
+        ANALYSIS_CACHE.inc(result='miss')
+        return self._request_analysis(update_text, regulator_name, regulation_type, detected_categories,
+                                      on_token, document)
+    
+    def _document_section(self, update_text, document):
+        if not document:
+            return ""
+        if update_text.get('diff'):
+            return f"\nCHANGES SINCE THE PREVIOUS VERSION (- removed, + added):\n{document}"
+        return f"\nDOCUMENT EXCERPT:\n{document}"
+    
+    def _request_analysis(self, update_text, regulator_name, regulation_type, detected_categories,
+                          on_token=None, document=None):
+        """Streamed single-update completion, cached on success"""
         user_prompt = f"""Analyze this regulatory update from {regulator_name}:
 
 TITLE: {update_text.get('title', 'N/A')}
 TYPE: {regulation_type}
 DETECTED CATEGORIES: {', '.join(detected_categories)}
 CONTENT: {update_text.get('summary', 'N/A')}
-SOURCE: {update_text.get('link', 'N/A')}
+SOURCE: {update_text.get('link', 'N/A')}{self._document_section(update_text, document)}
 
 Provide analysis in this exact format:
 
@@ -118,27 +296,23 @@ Example format:
 
 Remember: Facts only. No speculation. Reference specific BSA/AML requirements."""
 
+        route = self.router.route(regulator_name, detected_categories)
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             payload = {
-                "model": "llama-3.3-70b",
+                "model": route.model,
                 "messages": [
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 "temperature": 0.1,
-                "max_tokens": 1500
+                "max_tokens": 1500,
+                "stream": True
             }
             
-            response = requests.post(self.api_url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            analysis = result['choices'][0]['message']['content']
+            with LLM_SECONDS.time():
+                analysis, usage = route.backend.complete(payload, on_token)
+            self._record_usage(payload, analysis, usage)
+            self.analysis_cache.set(self.cache_key(update_text, document, route.model), analysis)
             
             return {
                 'update': update_text,
@@ -149,27 +323,233 @@ Remember: Facts only. No speculation. Reference specific BSA/AML requirements.""
             }
             
         except Exception as e:
+            ANALYSIS_ERRORS.inc()
             print(f"Error analyzing update from {regulator_name}: {str(e)}")
             return {
                 'update': update_text,
                 'analysis': f"Analysis unavailable: {str(e)}",
                 'regulator': regulator_name,
                 'regulation_type': regulation_type,
-                'categories': detected_categories
+                'categories': detected_categories,
+                'error': str(e)
             }
     
-    def batch_analyze(self, updates_by_regulator):
-        """Analyze multiple updates from multiple regulators"""
-        analyzed_results = []
+    def _batch_item(self, item_id, update_text, regulator_name, regulation_type, detected_categories, document=None):
+        return f"""ITEM ID: {item_id}
+REGULATOR: {regulator_name}
+TITLE: {update_text.get('title', 'N/A')}
+TYPE: {regulation_type}
+DETECTED CATEGORIES: {', '.join(detected_categories)}
+CONTENT: {update_text.get('summary', 'N/A')}
+SOURCE: {update_text.get('link', 'N/A')}{self._document_section(update_text, document)}
+"""
+    
+    def _plan_batches(self, items):
+        """Greedily pack (key, estimated prompt tokens) pairs into batches within size and token limits"""
+        base_tokens = (len(self.system_prompt) + len(BATCH_PROMPT)) // 4
+        batches, current, used = [], [], base_tokens
+        for key, tokens in items:
+            cost = tokens + BATCH_COMPLETION_TOKENS_PER_ITEM
+            if current and (len(current) >= ANALYSIS_BATCH_SIZE or used + cost > ANALYSIS_BATCH_TOKENS):
+                batches.append(current)
+                current, used = [], base_tokens
+            current.append(key)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _request_batch(self, items):
+        """
+        Analyze several uncached updates in one JSON-schema completion.
+        items are (update, regulator, regulation_type, categories, document) sharing one route; returns
+        {index into items: structured analysis} for the entries that came back valid, caching each
+        with its formatted text. Errors return what was parsed so far.
+        """
+        route = self.router.route(items[0][1], items[0][3])
+        ids = [str(n) for n in range(1, len(items) + 1)]
+        blocks = [self._batch_item(item_id, *item) for item_id, item in zip(ids, items)]
+        payload = {
+            "model": route.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": BATCH_PROMPT.format(count=len(items), items='\n'.join(blocks))}
+            ],
+            "temperature": 0.1,
+            "max_tokens": BATCH_COMPLETION_TOKENS_PER_ITEM * len(items),
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "compliance_analyses", "strict": True, "schema": ANALYSIS_SCHEMA}
+            },
+            # Streamed so the read timeout applies between chunks rather than to the whole, long
+            # completion; the JSON is collected from the deltas
+            "stream": True
+        }
+        
+        try:
+            with LLM_SECONDS.time():
+                # A timed-out batch is not re-sent: its items fall back to single-update calls
+                content, usage = route.backend.complete(payload, retry_timeouts=False)
+            self._record_usage(payload, content, usage)
+        except Exception as e:
+            print(f"Error analyzing batch of {len(items)} updates, retrying individually: {str(e)}")
+            return {}
+        
+        parsed = parse_batch_response(content, ids)
+        analyses = {}
+        for index, item_id in enumerate(ids):
+            if item_id in parsed:
+                analyses[index] = parsed[item_id]
+                self.analysis_cache.set(self.cache_key(items[index][0], items[index][4], route.model),
+                                        {'analysis': format_analysis(parsed[item_id]), 'structured': parsed[item_id]})
+        return analyses
+    
+    def batch_analyze(self, updates_by_regulator, on_token=None, on_result=None, on_retry=None):
+        """
+        Analyze multiple updates from multiple regulators.
+        
+        Updates are clustered, scored for AML relevance and only the top ANALYSIS_TOP_K
+        clusters at or above RELEVANCE_THRESHOLD are analyzed, most relevant first. Uncached
+        items are packed into batched JSON-schema requests of up to ANALYSIS_BATCH_SIZE.
+        on_token(update, regulator, text) receives streamed analysis text as it arrives (batched
+        items arrive whole) and on_result(result) each finished analysis, in completion order.
+        Results of batched requests also carry "structured": the JSON fields behind their text.
+        on_retry(update) receives every input update that should be offered again by a later run:
+        members of clusters whose analysis failed (those results carry an "error") and of relevant
+        clusters cut only by ANALYSIS_TOP_K. Items below RELEVANCE_THRESHOLD are not retried.
+        """
+        jobs = []
         
         for regulator, data in updates_by_regulator.items():
             updates = data['updates']
             reg_type = data['type']
             
-            print(f"  Analyzing {len(updates[:3])} updates from {regulator}...")
+            for update in updates:
+                jobs.append((update, regulator, reg_type))
+        
+        # The same advisory re-announced by several regulators is analyzed once
+        clusters = cluster_texts([f"{u.get('title', '')} {u.get('summary', '')}" for u, _, _ in jobs])
+        if len(clusters) < len(jobs):
+            print(f"  Merged {len(jobs)} updates into {len(clusters)} distinct items")
+        
+        # Spend the LLM budget on the most AML-relevant items across all regulators
+        scores = RELEVANCE_SCORER.score([
+            (jobs[members[0]][0].get('title', ''), jobs[members[0]][0].get('summary', ''))
+            for members in clusters
+        ])
+        ranked = sorted(
+            (pair for pair in zip(scores, clusters) if pair[0] >= RELEVANCE_THRESHOLD),
+            key=lambda pair: pair[0], reverse=True
+        )
+        clusters = [members for _, members in ranked[:ANALYSIS_TOP_K]]
+        if on_retry:
+            # Relevant but over budget: carried over to the next run rather than dropped
+            for _, members in ranked[ANALYSIS_TOP_K:]:
+                for i in members:
+                    on_retry(jobs[i][0])
+        print(f"  Analyzing {len(clusters)} of {len(scores)} items "
+              f"(relevance >= {RELEVANCE_THRESHOLD}, top {ANALYSIS_TOP_K})")
+        
+        def token_callback(update, regulator):
+            if on_token:
+                return lambda text: on_token(update, regulator, text)
+            return None
+        
+        def finish(members, result):
+            if result.get('error') and on_retry:
+                for i in members:
+                    on_retry(jobs[i][0])
+            result['sources'] = [
+                {'regulator': jobs[i][1], 'title': jobs[i][0].get('title', ''), 'link': jobs[i][0].get('link', '')}
+                for i in members
+            ]
+            if on_result:
+                on_result(result)
+            return result
+        
+        def analyze_cluster(members):
+            update, regulator, reg_type = jobs[members[0]]
+            result = self.analyze_update(update, regulator, reg_type, on_token=token_callback(update, regulator),
+                                         document=documents.get(members[0]))
+            return [finish(members, result)]
+        
+        def analyze_batch(batch):
+            items = []
+            for members in batch:
+                update, regulator, reg_type = jobs[members[0]]
+                categories = self.detect_categories(f"{update.get('title', '')} {update.get('summary', '')}")
+                items.append((update, regulator, reg_type, categories, documents.get(members[0])))
             
-            for update in updates[:3]:
-                analysis = self.analyze_update(update, regulator, reg_type)
-                analyzed_results.append(analysis)
+            analyses = self._request_batch(items)
+            results = []
+            for index, (members, item) in enumerate(zip(batch, items)):
+                update, regulator, reg_type, categories, document = item
+                if index in analyses:
+                    BATCH_ITEMS.inc(result='parsed')
+                    analysis = format_analysis(analyses[index])
+                    callback = token_callback(update, regulator)
+                    if callback:
+                        callback(analysis)
+                    result = {
+                        'update': update,
+                        'analysis': analysis,
+                        'structured': analyses[index],
+                        'regulator': regulator,
+                        'regulation_type': reg_type,
+                        'categories': categories
+                    }
+                else:
+                    # Missing or malformed in the batch reply: fall back to a single-update call
+                    BATCH_ITEMS.inc(result='fallback')
+                    result = self._request_analysis(update, regulator, reg_type, categories,
+                                                    on_token=token_callback(update, regulator), document=document)
+                results.append(finish(members, result))
+            return results
+        
+        # Living-document changes carry their own diff; other document bodies are only fetched
+        # for the items that made the cut
+        documents = {members[0]: jobs[members[0]][0]['diff'] for members in clusters if jobs[members[0]][0].get('diff')}
+        if self.document_fetcher is not None:
+            links = {members[0]: jobs[members[0]][0].get('link') for members in clusters if members[0] not in documents}
+            chunks_by_link = self.document_fetcher.fetch_many(links.values())
+            for index, link in links.items():
+                if link in chunks_by_link:
+                    documents[index] = excerpt(chunks_by_link[link], DOCUMENT_PROMPT_CHARS,
+                                               score=lambda chunk: len(self.find_keywords(chunk)))
+            print(f"  Extracted {sum(1 for index in links if index in documents)} of {len(links)} linked documents")
+        
+        # Cached items are answered directly; the rest are packed into batched requests per route
+        uncached = {}
+        for position, members in enumerate(clusters):
+            update, regulator, reg_type = jobs[members[0]]
+            document = documents.get(members[0])
+            categories = self.detect_categories(f"{update.get('title', '')} {update.get('summary', '')}")
+            route = self.router.route(regulator, categories)
+            if self.analysis_cache.get(self.cache_key(update, document, route.model)) is None:
+                prompt_tokens = len(self._batch_item('0', update, regulator, reg_type, [], document)) // 4
+                uncached.setdefault(route.key, []).append((position, prompt_tokens))
+        batches = [batch for group in uncached.values() for batch in self._plan_batches(group)] if ANALYSIS_BATCH_SIZE > 1 else []
+        batches = [batch for batch in batches if len(batch) > 1]
+        batched = {position for batch in batches for position in batch}
+        
+        units = [[position] for position in range(len(clusters)) if position not in batched] + batches
+        units.sort(key=lambda unit: unit[0])
+        if batches:
+            print(f"  Packed {len(batched)} uncached items into {len(batches)} batched requests")
+        
+        def analyze_unit(unit):
+            if len(unit) == 1:
+                return analyze_cluster(clusters[unit[0]])
+            for position in unit:
+                ANALYSIS_CACHE.inc(result='miss')
+            return analyze_batch([clusters[position] for position in unit])
+        
+        # Workers share the session and rate limiters; results are returned in relevance order
+        analyzed_results = [None] * len(clusters)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for unit, results in zip(units, executor.map(analyze_unit, units)):
+                for position, result in zip(unit, results):
+                    analyzed_results[position] = result
         
+        self.analysis_cache.flush()
         return analyzed_results
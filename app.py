@@ -2,103 +2,330 @@
 Main Flask application for AML/BSA Compliance Agent
 """
 
-from flask import Flask, render_template, jsonify, request
+from dotenv import load_dotenv
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context
 from regulatory_sources import REGULATORY_SOURCES, REGULATION_CATEGORIES
-from scraper import RegulatoryScraper
-from ai_analyzer import ComplianceAnalyzer
-from email_service import EmailService
-import schedule
-import threading
+from storage import UpdateStore, DEFAULT_PAGE_SIZE
+from http_cache import ResponseCache, cached_json_response
+from events import EventRelay
+from metrics import REGISTRY, SCAN_STAGE_SECONDS, SCANS
+import sqlite3
+import json
 import time
 from datetime import datetime
 import os
 
+# Read before any module-level configuration; the scan modules are imported on first use
+# (see run_daily_scan) so web workers boot with Flask and SQLite only
+load_dotenv()
+
 app = Flask(__name__)
 
-latest_updates = []
-last_refresh = None
+# Shared by every gunicorn worker, so results survive restarts
+store = UpdateStore()
+# Serialized API responses, reused until the next scan completes
+response_cache = ResponseCache()
+# Live scan progress, relayed through the store to /api/stream subscribers in every process
+scan_events = EventRelay(store)
+# Requests the dashboard makes on load (see fetchUpdates in index.html), pre-built at worker boot
+DASHBOARD_WARM_PATHS = (
+    '/api/updates?regulator=all&type=all&category=all&fields=summary',
+    '/api/updates'
+)
 
 def run_daily_scan():
-    """Main function to scan regulators and analyze updates"""
-    global latest_updates, last_refresh
+    """Main function to scan regulators and analyze updates; returns the scan id"""
+    from scraper import RegulatoryScraper
+    from snapshots import SnapshotTracker, snapshot_fetcher
+    from email_service import EmailService
     
     print(f"\nStarting scan: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     
-    scraper = RegulatoryScraper()
-    analyzer = ComplianceAnalyzer()
-    email_service = EmailService()
+    # Incremental: only entries past each feed's high-water mark are analyzed and emailed
+    scraper = RegulatoryScraper(mark_store=store)
+    # Living documents and linked documents share the scraper's session and per-host throttle
+    snapshots = SnapshotTracker(store, snapshot_fetcher(session=scraper.session, throttle=scraper.throttle))
+    scan_id = store.start_scan()
+    scan_events.publish('scan_started', {'scan_id': scan_id})
+    # Metrics are process-wide; the scan's report is what changed while it ran
+    metrics_before = REGISTRY.snapshot()
+    started = time.perf_counter()
+    # Updates whose analysis failed; their feed marks are held back so the next scan retries them
+    retry = []
+    try:
+        analyzed = _scan_and_analyze(scraper, snapshots, retry)
+    except Exception as e:
+        store.finish_scan(scan_id, [], status='failed')
+        SCANS.inc(status='failed')
+        store.save_scan_report(scan_id, _scan_report(metrics_before, started, error=str(e)))
+        scan_events.publish('scan_failed', {'scan_id': scan_id, 'error': str(e)})
+        raise
+    
+    with SCAN_STAGE_SECONDS.time(stage='store'):
+        store.finish_scan(scan_id, analyzed)
+        scraper.commit_feed_marks(retry)
+        snapshots.commit(retry)
+    scan_events.publish('scan_completed', {'scan_id': scan_id, 'count': len(analyzed)})
+    
+    # Failed analyses are emailed once they succeed on a later scan
+    emailed = [item for item in analyzed if not item.get('error')]
+    if emailed:
+        print("\nSending email...")
+        with SCAN_STAGE_SECONDS.time(stage='email'):
+            EmailService().send_daily_summary(emailed)
+    else:
+        print("\nNo new updates since last scan, skipping email")
+    
+    SCANS.inc(status='completed')
+    report = _scan_report(metrics_before, started, updates=len(analyzed))
+    store.save_scan_report(scan_id, report)
+    stages = report['metrics'].get('aml_scan_stage_seconds', {})
+    print("\nScan completed in {:.1f}s ({})\n".format(
+        report['duration_seconds'],
+        ', '.join(f"{label.split('=', 1)[1]} {value['seconds']:.1f}s" for label, value in stages.items())
+    ))
+    return scan_id
+
+def _scan_report(metrics_before, started, **fields):
+    """Per-scan JSON report: duration plus every metric that changed during the scan"""
+    report = {'duration_seconds': round(time.perf_counter() - started, 3)}
+    report.update(fields)
+    report['metrics'] = REGISTRY.report(metrics_before)
+    cache = report['metrics'].get('aml_analysis_cache_total', {})
+    lookups = sum(cache.values())
+    if lookups:
+        report['analysis_cache_hit_rate'] = round(cache.get('result=hit', 0) / lookups, 3)
+    return report
+
+def _scan_and_analyze(scraper, snapshots, retry):
+    """Fetch every regulator and changed living document, and analyze the results; updates to retry are appended to retry"""
+    from concurrent.futures import ThreadPoolExecutor
+    from ai_analyzer import ComplianceAnalyzer
+    from documents import DocumentFetcher, FETCH_DOCUMENTS
+    
+    # Linked documents keep DOCUMENT_MAX_TEXT_CHARS; only living-document snapshots are uncapped
+    document_fetcher = DocumentFetcher(session=scraper.session, throttle=scraper.throttle) if FETCH_DOCUMENTS else None
+    analyzer = ComplianceAnalyzer(document_fetcher=document_fetcher)
     
     updates_by_regulator = {}
     
+    print(f"Fetching from {len(REGULATORY_SOURCES)} regulators...")
+    fetch_started = time.monotonic()
+    with SCAN_STAGE_SECONDS.time(stage='fetch'):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            changes = executor.submit(snapshots.check_all, REGULATORY_SOURCES)
+            fetched = scraper.fetch_all_updates(REGULATORY_SOURCES)
+            changes = changes.result()
+    
     for regulator_code, config in REGULATORY_SOURCES.items():
-        print(f"Fetching from {config['name']}...")
-        updates = scraper.fetch_regulator_updates(config)
+        updates = fetched.get(regulator_code, []) + changes.get(regulator_code, [])
         
         if updates:
             updates_by_regulator[config['name']] = {
                 'updates': updates,
                 'type': config['type']
             }
-            print(f"  Found {len(updates)} updates")
-        
-        time.sleep(2)
+            print(f"  {config['name']}: found {len(updates)} updates")
     
-    print("\nAnalyzing with AI...")
-    analyzed = analyzer.batch_analyze(updates_by_regulator)
+    print(f"Fetched all feeds in {time.monotonic() - fetch_started:.1f}s")
+    scan_events.publish('fetch_completed', {
+        'regulators': len(updates_by_regulator),
+        'updates': sum(len(data['updates']) for data in updates_by_regulator.values())
+    })
     
-    latest_updates = analyzed
-    last_refresh = datetime.now()
+    def on_token(update, regulator, text):
+        scan_events.publish('analysis_delta', {
+            'id': analyzer.cache_key(update)[:16],
+            'regulator': regulator,
+            'title': update.get('title', ''),
+            'text': text
+        })
     
-    print("\nSending email...")
-    email_service.send_daily_summary(analyzed)
-    print("\nScan completed\n")
-
-def schedule_daily_scans():
-    """Schedule daily scans at 8 AM EST (13:00 UTC)"""
-    schedule.every().day.at("13:00").do(run_daily_scan)
+    def on_result(result):
+        scan_events.publish('analysis', {'id': analyzer.cache_key(result['update'])[:16], 'result': result})
     
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    print("\nAnalyzing with AI...")
+    with SCAN_STAGE_SECONDS.time(stage='analyze'):
+        return analyzer.batch_analyze(updates_by_regulator, on_token=on_token, on_result=on_result,
+                                      on_retry=retry.append)
+
+def results_are_stale(max_age_hours=24):
+    """True when there is no completed scan newer than max_age_hours"""
+    last_scan = store.last_scan()
+    if last_scan is None:
+        return True
+    age = datetime.now() - datetime.fromisoformat(last_scan['finished_at'])
+    return age.total_seconds() > max_age_hours * 3600
+
+def warm_caches():
+    """Build the dashboard page and its first API responses from stored results, so a fresh worker answers from memory"""
+    with app.test_request_context('/'):
+        index()
+    for path in DASHBOARD_WARM_PATHS:
+        with app.test_request_context(path):
+            get_updates()
 
 @app.route('/')
 def index():
     """Render main dashboard"""
+    # A page opened mid-scan follows that job instead of holding a stream open indefinitely
+    active_job = store.active_job()
     return render_template('index.html', 
                          regulators=REGULATORY_SOURCES,
-                         categories=REGULATION_CATEGORIES)
+                         categories=REGULATION_CATEGORIES,
+                         active_job_id=active_job['id'] if active_job else None)
+
+def _filter_arg(name):
+    """Query argument with the dashboard's 'all' placeholder treated as no filter"""
+    value = request.args.get(name)
+    return None if not value or value == 'all' else value
+
+def _data_version():
+    """Changes whenever a scan completes or a backfill writes; keys the ETag and response cache"""
+    last_scan = store.last_scan()
+    scan_version = f"{last_scan['id']}:{last_scan['finished_at']}" if last_scan else "empty"
+    return f"{scan_version}:{store.latest_analysis_id()}"
 
 @app.route('/api/updates')
 def get_updates():
-    """API endpoint to get latest updates"""
-    filters = {
-        'regulator': request.args.get('regulator'),
-        'type': request.args.get('type'),
-        'category': request.args.get('category')
-    }
-    
-    filtered_updates = latest_updates
+    """API endpoint to get latest updates, paginated newest first"""
+    return cached_json_response(response_cache, _data_version(), _build_updates_page)
+
+def _build_updates_page():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return {'error': 'limit must be an integer'}, 400
     
-    # Filter by regulator
-    if filters['regulator'] and filters['regulator'] != 'all':
-        filtered_updates = [u for u in filtered_updates if u['regulator'] == filters['regulator']]
+    # fields=summary omits analysis text; fetch it per item from /api/updates/<id>
+    include_analysis = request.args.get('fields', 'full') != 'summary'
     
-    # Filter by category
-    if filters['category'] and filters['category'] != 'all':
-        filtered_updates = [u for u in filtered_updates 
-                          if filters['category'] in u.get('categories', [])]
+    try:
+        filtered_updates, next_cursor = store.query_updates(
+            regulator=_filter_arg('regulator'),
+            category=_filter_arg('category'),
+            regulation_type=_filter_arg('type'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            include_analysis=include_analysis
+        )
+    except ValueError:
+        return {'error': 'invalid cursor'}, 400
+    last_scan = store.last_scan()
     
-    return jsonify({
+    return {
         'updates': filtered_updates,
-        'last_refresh': last_refresh.isoformat() if last_refresh else None,
-        'count': len(filtered_updates)
-    })
+        'last_refresh': last_scan['finished_at'] if last_scan else None,
+        'count': len(filtered_updates),
+        'next_cursor': next_cursor
+    }, 200
+
+@app.route('/api/updates/<int:update_id>')
+def get_update(update_id):
+    """API endpoint to get one update with its full analysis"""
+    def build():
+        result = store.get_update(update_id)
+        if result is None:
+            return {'error': 'update not found'}, 404
+        return result, 200
+    
+    return cached_json_response(response_cache, _data_version(), build)
+
+@app.route('/api/search')
+def search_updates():
+    """Full-text search over titles, summaries and analyses, best matches first"""
+    def build():
+        query = request.args.get('q', '').strip()
+        if not query:
+            return {'error': 'q is required'}, 400
+        if not store.search_enabled:
+            return {'error': 'full-text search is not available'}, 503
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return {'error': 'limit and offset must be integers'}, 400
+        
+        try:
+            results, has_more = store.search(query, regulator=_filter_arg('regulator'),
+                                             limit=limit, offset=offset)
+        except sqlite3.OperationalError as e:
+            return {'error': f'invalid search query: {str(e)}'}, 400
+        
+        return {'query': query, 'results': results, 'count': len(results), 'has_more': has_more}, 200
+    
+    return cached_json_response(response_cache, _data_version(), build)
 
 @app.route('/api/refresh')
 def manual_refresh():
-    """Manually trigger a scan"""
-    threading.Thread(target=run_daily_scan, daemon=True).start()
-    return jsonify({'status': 'Scan initiated'})
+    """Manually trigger a scan; overlapping requests share the queued or running job"""
+    job, coalesced = store.enqueue_scan('manual')
+    return jsonify({
+        'status': 'Scan already in progress' if coalesced else 'Scan initiated',
+        'job_id': job['id'],
+        'job_status': job['status']
+    }), 202
+
+@app.route('/api/jobs/<int:job_id>')
+def get_job(job_id):
+    """Status of a scan job"""
+    job = store.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/scans/<int:scan_id>')
+def get_scan(scan_id):
+    """A scan run with its per-stage timing and metrics report"""
+    scan = store.get_scan(scan_id)
+    if scan is None:
+        return jsonify({'error': 'scan not found'}), 404
+    return jsonify(scan)
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus metrics of the scan leader, whichever process this is, plus the last completed
+    scan from the shared store. Only the leader scans, so other processes' counters stay empty.
+    """
+    published = store.published_metrics('scan-leader')
+    lines = [published[1] if published else REGISTRY.render()]
+    if published:
+        lines.append(
+            "# HELP aml_metrics_age_seconds Time since the scan leader last published its metrics\n"
+            "# TYPE aml_metrics_age_seconds gauge\n"
+            f"aml_metrics_age_seconds {time.time() - published[2]:.0f}\n"
+        )
+    last_scan = store.last_scan()
+    if last_scan is not None:
+        finished = datetime.fromisoformat(last_scan['finished_at']).timestamp()
+        lines.append(
+            "# HELP aml_last_scan_timestamp_seconds Finish time of the last completed scan\n"
+            "# TYPE aml_last_scan_timestamp_seconds gauge\n"
+            f"aml_last_scan_timestamp_seconds {finished:.0f}\n"
+            "# HELP aml_last_scan_updates Updates analyzed by the last completed scan\n"
+            "# TYPE aml_last_scan_updates gauge\n"
+            f"aml_last_scan_updates {last_scan['update_count']}\n"
+        )
+        report = json.loads(last_scan['report']) if last_scan['report'] else None
+        if report:
+            lines.append(
+                "# HELP aml_last_scan_duration_seconds Wall time of the last completed scan\n"
+                "# TYPE aml_last_scan_duration_seconds gauge\n"
+                f"aml_last_scan_duration_seconds {report['duration_seconds']}\n"
+            )
+    return Response(''.join(lines), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stream')
+def stream_events():
+    """Server-sent events with scan progress and each analysis as it is produced"""
+    response = Response(stream_with_context(scan_events.stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 if __name__ == '__main__':
     # This only runs locally, not on Render with gunicorn
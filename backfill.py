@@ -0,0 +1,172 @@
+"""
+Historical backfill: analyze past regulator publications over a date range.
+
+    python backfill.py --since 2024-01-01 [--until 2024-06-30] [--regulator FinCEN ...]
+
+Runs as a generator pipeline (windows -> entries -> batches -> analysis -> store) so memory
+stays flat however many items are processed. Each (regulator, source, window) is checkpointed
+once its batches are stored and none of its analyses failed, so a crashed run resumes where it
+stopped and failures are retried. Items that already have a successful stored or cached analysis
+are skipped; the analysis and document caches are the regular scan's.
+"""
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+from itertools import islice
+from ai_analyzer import ComplianceAnalyzer
+from documents import DocumentFetcher, FETCH_DOCUMENTS
+from regulatory_sources import REGULATORY_SOURCES, FEDERAL_REGISTER_AGENCIES
+from relevance import ANALYSIS_TOP_K
+from scraper import FEED_TIMEOUT, RegulatoryScraper
+from storage import UpdateStore, update_key
+
+FEDERAL_REGISTER_API = os.getenv('FEDERAL_REGISTER_API', 'https://www.federalregister.gov/api/v1/documents.json')
+# Items analyzed and written per transaction
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', '20'))
+FEDERAL_REGISTER_PAGE_SIZE = 100
+
+
+def month_windows(since, until):
+    """Calendar-month (start, end) date pairs covering since..until, so reruns hit the same checkpoints"""
+    start = since
+    while start <= until:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        yield start, min(until, next_month - timedelta(days=1))
+        start = next_month
+
+
+def batched(iterable, size):
+    """Lists of up to size items, pulled lazily from iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def federal_register_entries(scraper, agency, start, end):
+    """A Federal Register agency's documents published between start and end, page by page"""
+    params = {
+        'conditions[agencies][]': agency,
+        'conditions[publication_date][gte]': start.isoformat(),
+        'conditions[publication_date][lte]': end.isoformat(),
+        'order': 'oldest',
+        'per_page': FEDERAL_REGISTER_PAGE_SIZE,
+        'fields[]': ['title', 'abstract', 'html_url', 'publication_date']
+    }
+    url = FEDERAL_REGISTER_API
+    while url:
+        response = scraper.throttle.run(url, scraper.session.get, url, params=params, timeout=FEED_TIMEOUT)
+        response.raise_for_status()
+        page = response.json()
+        for document in page.get('results') or []:
+            yield {
+                'title': document.get('title') or 'No title',
+                'link': document.get('html_url', ''),
+                'summary': (document.get('abstract') or '')[:500],
+                'date': document.get('publication_date', ''),
+                'published': document.get('publication_date')
+            }
+        # next_page_url already carries the query
+        url, params = page.get('next_page_url'), None
+
+
+def current_entries(scraper, kind, url, start, end):
+    """Entries a feed or listing page still shows, limited to start..end (undated entries are kept)"""
+    for entry in scraper.fetch_all_entries(kind, url):
+        published = entry.get('published')
+        if published and not start.isoformat() <= published[:10] <= end.isoformat():
+            continue
+        yield entry
+
+
+def backfill_units(scraper, regulator_code, config, since, until):
+    """(source, window_start, window_end, entries generator) for one regulator"""
+    agency = FEDERAL_REGISTER_AGENCIES.get(regulator_code)
+    if agency:
+        for start, end in month_windows(since, until):
+            yield f"federal-register:{agency}", start, end, federal_register_entries(scraper, agency, start, end)
+
+    # Feeds and listings have no history to page through: one unit each over the whole range
+    for kind, url in scraper._source_jobs(config):
+        yield url, since, until, current_entries(scraper, kind, url, since, until)
+
+
+def backfill(since, until, regulator_codes, batch_size=BACKFILL_BATCH_SIZE, store=None):
+    """Analyze and store every relevant, not yet analyzed item; returns the number stored"""
+    store = store if store is not None else UpdateStore()
+    # A batch larger than the analyzer's top-K would silently drop relevant items from a checkpointed window
+    batch_size = min(batch_size, ANALYSIS_TOP_K)
+    scraper = RegulatoryScraper()
+    document_fetcher = DocumentFetcher(session=scraper.session, throttle=scraper.throttle) if FETCH_DOCUMENTS else None
+    analyzer = ComplianceAnalyzer(document_fetcher=document_fetcher)
+
+    # Recorded as its own run so it never stands in for the latest daily scan
+    scan_id = store.start_scan()
+    stored = 0
+    try:
+        for code in regulator_codes:
+            config = REGULATORY_SOURCES[code]
+            name = config['name']
+            for source, start, end, entries in backfill_units(scraper, code, config, since, until):
+                window = (start.isoformat(), end.isoformat())
+                if store.backfill_done(code, source, *window):
+                    continue
+
+                window_stored = window_failed = 0
+                try:
+                    for batch in batched(entries, batch_size):
+                        done = store.analyzed_keys(name, batch)
+                        pending = [u for u in batch if update_key(name, u) not in done]
+                        if not pending:
+                            continue
+                        analyzed = analyzer.batch_analyze({name: {'updates': pending, 'type': config['type']}})
+                        # Placeholders for failed analyses are not stored; the next run retries them
+                        succeeded = [result for result in analyzed if not result.get('error')]
+                        store.save_analyses(scan_id, succeeded)
+                        window_stored += len(succeeded)
+                        window_failed += len(analyzed) - len(succeeded)
+                except Exception as e:
+                    # Leave the window uncheckpointed so the next run retries it
+                    print(f"✗ {code} {source} {window[0]}..{window[1]}: {str(e)}")
+                    continue
+
+                stored += window_stored
+                if window_failed:
+                    # Left uncheckpointed so the next run retries the failed items
+                    print(f"✗ {code} {source} {window[0]}..{window[1]}: stored {window_stored}, "
+                          f"{window_failed} analyses failed")
+                    continue
+                store.save_backfill_checkpoint(code, source, *window, window_stored)
+                print(f"{code} {source} {window[0]}..{window[1]}: stored {window_stored}")
+    finally:
+        store.finish_scan(scan_id, [], status='backfill', update_count=stored)
+    return stored
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--since', type=_parse_date, required=True, help='first publication date (YYYY-MM-DD)')
+    parser.add_argument('--until', type=_parse_date, default=date.today(), help='last publication date (default today)')
+    parser.add_argument('--regulator', action='append', choices=sorted(REGULATORY_SOURCES),
+                        help='regulator code to backfill; repeat for several (default all)')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE,
+                        help='items analyzed and stored per batch')
+    args = parser.parse_args()
+
+    if args.since > args.until:
+        parser.error('--since must not be after --until')
+    stored = backfill(args.since, args.until, args.regulator or list(REGULATORY_SOURCES), max(1, args.batch_size))
+    print(f"\nBackfill completed: {stored} analyses stored")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
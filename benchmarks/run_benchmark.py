@@ -0,0 +1,215 @@
+"""
+Offline end-to-end benchmark of the daily scan.
+
+Serves recorded feed/listing fixtures, a streaming chat-completions stub and a SendGrid stub
+from localhost, then runs a cold scan (empty caches and database) followed by a warm scan and
+reports per-stage timings, peak Python memory and request counts as JSON.
+
+    python benchmarks/run_benchmark.py --llm-latency 0.5 --output report.json
+"""
+
+import argparse
+import functools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import FIXTURE_DIR, StubState, start_server
+
+# Functions the scan no longer calls, and the stage that now measures their work.
+# fetch_all_updates fetches every regulator's sources concurrently instead of calling
+# fetch_regulator_updates per regulator; fetch_feed and fetch_listing break it down per source.
+SUPERSEDED_STAGES = {
+    'RegulatoryScraper.fetch_regulator_updates': 'fetch_all'
+}
+
+
+def fixture_name(url, kind):
+    """File name a source URL is recorded under"""
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', url.split('://', 1)[1]).strip('_')
+    return slug + ('.xml' if kind == 'rss' else '.html')
+
+
+class StageTimer:
+    """Wall-clock totals and call counts per named stage, safe across scan threads"""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        # Stage name -> the function it times, for the report
+        self.functions = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, owner, attribute, stage):
+        original = getattr(owner, attribute)
+        self.functions[stage] = f"{getattr(owner, '__name__', type(owner).__name__)}.{attribute}"
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.totals[stage] += elapsed
+                    self.calls[stage] += 1
+
+        setattr(owner, attribute, timed)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: {'seconds': round(self.totals[stage], 4), 'calls': self.calls[stage]}
+                    for stage in sorted(self.totals)}
+
+    def reset(self):
+        with self._lock:
+            self.totals.clear()
+            self.calls.clear()
+
+
+def point_sources_at_stubs(sources, listing_selectors, state):
+    """
+    Rewrite source URLs in place to localhost stubs, one server per original host so the
+    scraper's per-host throttling behaves as it does in production. Sources without a
+    recorded fixture are dropped.
+    """
+    servers = {}
+
+    def stub_url(url, kind):
+        name = fixture_name(url, kind)
+        if not os.path.exists(os.path.join(FIXTURE_DIR, name)):
+            return None
+        host = urlsplit(url).netloc
+        if host not in servers:
+            servers[host] = start_server(state)
+        return f"{servers[host][1]}/{name}"
+
+    for config in sources.values():
+        feeds = [stub_url(url, 'rss') for url in config.get('rss_feeds', [])]
+        config['rss_feeds'] = [url for url in feeds if url]
+
+        pages = []
+        for url in config.get('urls', []):
+            if url not in listing_selectors:
+                continue
+            local = stub_url(url, 'listing')
+            if local:
+                listing_selectors[local] = listing_selectors.pop(url)
+                pages.append(local)
+        config['urls'] = pages
+
+    return [server for server, _ in servers.values()]
+
+
+def run_scan(app_module, timer, state, label):
+    """Run one full scan and return its measurements"""
+    timer.reset()
+    state.counts.clear()
+    tracemalloc.start()
+    started = time.perf_counter()
+    scan_id = app_module.run_daily_scan()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'scan': label,
+        'scan_id': scan_id,
+        'total_seconds': round(elapsed, 4),
+        'peak_memory_mb': round(peak / (1024 * 1024), 2),
+        'results': len(app_module.store.latest_results()),
+        'stages': timer.snapshot(),
+        'requests': dict(sorted(state.counts.items())),
+        'scan_report': app_module.store.get_scan(scan_id)['report']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--feed-latency', type=float, default=0.05, help='seconds per feed/listing response')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='seconds per streamed completion')
+    parser.add_argument('--email-latency', type=float, default=0.1, help='seconds per email send')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--max-seconds', type=float,
+                        help='exit non-zero if the cold scan takes longer than this (for CI)')
+    args = parser.parse_args()
+
+    state = StubState(feed_latency=args.feed_latency, llm_latency=args.llm_latency,
+                      email_latency=args.email_latency)
+    _, api_base = start_server(state)
+
+    workdir = tempfile.mkdtemp(prefix='aml-benchmark-')
+    os.environ['CACHE_DIR'] = os.path.join(workdir, 'cache')
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'compliance.db')
+    os.environ['VENICE_API_URL'] = f"{api_base}/chat/completions"
+    os.environ['SENDGRID_API_URL'] = f"{api_base}/email"
+    os.environ.setdefault('VENICE_API_KEY', 'benchmark')
+    os.environ.setdefault('SENDGRID_API_KEY', 'benchmark')
+    os.environ.setdefault('EMAIL_ADDRESS', 'benchmark@example.com')
+    os.environ.setdefault('EMAIL_SUBSCRIBERS_FILE', os.path.join(ROOT, 'subscribers.example.json'))
+    # The stub has no rate limits; keep the client-side limiter out of the measurement
+    os.environ.setdefault('LLM_REQUESTS_PER_MINUTE', '100000')
+    os.environ.setdefault('LLM_TOKENS_PER_MINUTE', '100000000')
+
+    # Imported only now so module-level configuration picks up the environment above
+    import app as app_module
+    import regulatory_sources
+    from scraper import RegulatoryScraper
+    from ai_analyzer import ComplianceAnalyzer
+    from email_service import EmailService
+
+    servers = point_sources_at_stubs(regulatory_sources.REGULATORY_SOURCES,
+                                     regulatory_sources.LISTING_SELECTORS, state)
+
+    timer = StageTimer()
+    timer.wrap(RegulatoryScraper, 'fetch_all_updates', 'fetch_all')
+    timer.wrap(RegulatoryScraper, 'fetch_rss_feed', 'fetch_feed')
+    timer.wrap(RegulatoryScraper, 'fetch_listing_page', 'fetch_listing')
+    timer.wrap(ComplianceAnalyzer, 'batch_analyze', 'analyze_all')
+    timer.wrap(ComplianceAnalyzer, 'detect_categories', 'categorize')
+    timer.wrap(ComplianceAnalyzer, 'analyze_update', 'analyze_single')
+    # Completion requests, whichever path makes them: batched items never go through analyze_update
+    timer.wrap(ComplianceAnalyzer, '_request_analysis', 'llm_call')
+    timer.wrap(ComplianceAnalyzer, '_request_batch', 'llm_batch_call')
+    timer.wrap(EmailService, 'create_html_email', 'email_render')
+    timer.wrap(EmailService, 'send_daily_summary', 'email_send')
+    timer.wrap(app_module.store, 'finish_scan', 'store_results')
+
+    report = {
+        'settings': {
+            'feed_latency': args.feed_latency,
+            'llm_latency': args.llm_latency,
+            'email_latency': args.email_latency,
+            'stub_hosts': len(servers)
+        },
+        'stage_functions': dict(sorted(timer.functions.items())),
+        'superseded_stages': SUPERSEDED_STAGES,
+        'scans': [run_scan(app_module, timer, state, 'cold'), run_scan(app_module, timer, state, 'warm')]
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+    if args.max_seconds is not None and report['scans'][0]['total_seconds'] > args.max_seconds:
+        print(f"Cold scan exceeded {args.max_seconds}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Local stand-ins for regulator sites, the chat-completions API and SendGrid, with configurable latency
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+STUB_ANALYSIS = """REGULATORY SUMMARY:
+The update announces changes to BSA/AML program requirements.
+
+APPLICABLE COMPLIANCE AREAS:
+BSA, CDD/KYC, SAR Filing
+
+COMPLIANCE IMPACTS FOR LARGE FINANCIAL INSTITUTIONS:
+- CDD Requirements: updated beneficial ownership verification steps
+
+ACTIONABLE RECOMMENDATIONS:
+- Update CDD procedures to reflect the revised requirements
+"""
+
+STUB_ENTRY = {
+    'summary': 'The update announces changes to BSA/AML program requirements.',
+    'compliance_areas': ['BSA', 'CDD/KYC', 'SAR Filing'],
+    'impacts': ['CDD Requirements: updated beneficial ownership verification steps'],
+    'recommendations': ['Update CDD procedures to reflect the revised requirements']
+}
+
+_ITEM_ID = re.compile(r'^ITEM ID: (\S+)', re.MULTILINE)
+_PLACEHOLDER = re.compile(r'\{\{(DAYS_AGO|DAYS_AGO_DATE):(\d+)\}\}')
+
+
+def render_fixture(text):
+    """Replace {{DAYS_AGO:n}} / {{DAYS_AGO_DATE:n}} so recorded items always fall inside the scan window"""
+    now = datetime.now(timezone.utc)
+
+    def substitute(match):
+        moment = now - timedelta(days=int(match.group(2)))
+        if match.group(1) == 'DAYS_AGO':
+            return format_datetime(moment)
+        return moment.strftime('%Y-%m-%d')
+
+    return _PLACEHOLDER.sub(substitute, text)
+
+
+class StubState:
+    """Latency settings and request counters shared by all stub servers"""
+
+    def __init__(self, feed_latency=0.0, llm_latency=0.0, llm_chunks=8, email_latency=0.0):
+        self.feed_latency = feed_latency
+        self.llm_latency = llm_latency
+        self.llm_chunks = max(1, llm_chunks)
+        self.email_latency = email_latency
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._rendered = {}
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def fixture(self, name):
+        """Rendered fixture body, cached so its ETag is stable across scans"""
+        with self._lock:
+            if name not in self._rendered:
+                with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as f:
+                    self._rendered[name] = render_fixture(f.read()).encode('utf-8')
+            return self._rendered[name]
+
+
+def _handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=b'', content_type='application/json', headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            name = self.path.lstrip('/').split('?', 1)[0]
+            kind = 'feed' if name.endswith('.xml') else 'listing'
+            time.sleep(state.feed_latency)
+            try:
+                body = state.fixture(name)
+            except OSError:
+                state.count(f'{kind}_404')
+                self._send(404)
+                return
+
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            if self.headers.get('If-None-Match') == etag:
+                state.count(f'{kind}_304')
+                self._send(304, headers={'ETag': etag})
+                return
+
+            state.count(kind)
+            content_type = 'application/rss+xml' if kind == 'feed' else 'text/html; charset=utf-8'
+            self._send(200, body, content_type, {'ETag': etag})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path.startswith('/email'):
+                state.count('email')
+                time.sleep(state.email_latency)
+                self._send(202)
+                return
+
+            state.count('llm')
+            payload = json.loads(body)
+            content = STUB_ANALYSIS
+            if payload.get('response_format'):
+                # Batched request: one structured entry per item in the prompt
+                ids = _ITEM_ID.findall(payload['messages'][-1]['content'])
+                content = json.dumps({'analyses': [dict(STUB_ENTRY, id=item_id) for item_id in ids]})
+            if not payload.get('stream'):
+                time.sleep(state.llm_latency)
+                reply = {'choices': [{'message': {'content': content}}],
+                         'usage': {'prompt_tokens': len(body) // 4, 'completion_tokens': len(content) // 4}}
+                self._send(200, json.dumps(reply).encode('utf-8'))
+                return
+
+            # Stream the canned content in chunks spread over the configured latency
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            size = -(-len(content) // state.llm_chunks)
+            for start in range(0, len(content), size):
+                time.sleep(state.llm_latency / state.llm_chunks)
+                chunk = {'choices': [{'delta': {'content': content[start:start + size]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return StubHandler
+
+
+def start_server(state):
+    """Start a stub server on a free localhost port; returns (server, base_url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
@@ -0,0 +1,113 @@
+"""
+Persistent on-disk caches shared by the scraper and analyzer
+"""
+
+import os
+import json
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, writes fall back to last-writer-wins
+    fcntl = None
+
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+
+
+class DiskCache:
+    """
+    Small key/value cache persisted as a single JSON file with LRU and age eviction. Several
+    processes (web workers, the scan worker, backfill) may share a file: each save merges what
+    is on disk under a file lock, so no process overwrites entries another one wrote.
+    """
+    
+    def __init__(self, name, max_entries=None, max_age=None, cache_dir=None, autosave=True):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.path = os.path.join(self.cache_dir, f"{name}.json")
+        self.max_entries = max_entries
+        self.max_age = max_age
+        # With autosave off, callers batch writes and call flush() themselves
+        self.autosave = autosave
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._entries = self._load()
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _expired(self, entry, now):
+        return self.max_age is not None and now - entry['stored_at'] > self.max_age
+    
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if self._expired(entry, now):
+                del self._entries[key]
+                return default
+            entry['accessed_at'] = now
+            return entry['value']
+    
+    def set(self, key, value):
+        """Store value under key, persisting immediately when autosave is on"""
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {'value': value, 'stored_at': now, 'accessed_at': now}
+            self._evict(now)
+            self._dirty = True
+            if self.autosave:
+                self._save()
+    
+    def flush(self):
+        """Persist any pending writes"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _evict(self, now):
+        if self.max_age is not None:
+            for key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[key]
+        
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            by_access = sorted(self._entries, key=lambda k: self._entries[k]['accessed_at'])
+            for key in by_access[:len(self._entries) - self.max_entries]:
+                del self._entries[key]
+    
+    def _merge(self, on_disk):
+        """Fold entries saved by other processes into ours; the newer write of a key wins"""
+        for key, entry in on_disk.items():
+            ours = self._entries.get(key)
+            if ours is None or entry['stored_at'] > ours['stored_at']:
+                self._entries[key] = entry
+            elif entry['accessed_at'] > ours['accessed_at']:
+                ours['accessed_at'] = entry['accessed_at']
+        self._evict(time.time())
+    
+    def _save(self):
+        """Merge and write under a file lock, atomically so a crash mid-write never leaves a corrupt cache"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._merge(self._load())
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f)
+                os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Error saving cache {self.path}: {str(e)}")
@@ -0,0 +1,89 @@
+"""
+Near-duplicate clustering of regulatory updates using MinHash signatures and LSH banding
+"""
+
+import os
+import re
+import random
+import zlib
+
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.6'))
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_SIZE = 3
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed so signatures are comparable across processes and runs
+_rng = random.Random(1970)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _shingles(text):
+    """Hashed word n-grams of text; short texts fall back to single words"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = words
+    else:
+        grams = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return {zlib.crc32(gram.encode('utf-8')) for gram in grams}
+
+
+def minhash(text):
+    """MinHash signature of text, or None if it has no words"""
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+    return [min(((a * s + b) % _PRIME) & _MAX_HASH for s in shingles) for a, b in _PERMUTATIONS]
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two signatures"""
+    matches = sum(1 for x, y in zip(signature_a, signature_b) if x == y)
+    return matches / NUM_PERMUTATIONS
+
+
+def cluster_texts(texts, threshold=DUPLICATE_THRESHOLD):
+    """
+    Group near-duplicate texts. Returns lists of indexes into texts; each cluster
+    keeps input order, so its first index is the earliest occurrence.
+    """
+    signatures = [minhash(text) for text in texts]
+    parent = list(range(len(texts)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    # Only items sharing an LSH band bucket are compared, instead of every pair
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    buckets = {}
+    for index, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        for band in range(LSH_BANDS):
+            key = (band, tuple(signature[band * rows:(band + 1) * rows]))
+            buckets.setdefault(key, []).append(index)
+    
+    # Every pair within a bucket: two members can be similar to each other but not to the first.
+    # Pairs sharing several buckets are compared once.
+    compared = set()
+    for members in buckets.values():
+        for position, first in enumerate(members):
+            for other in members[position + 1:]:
+                if (first, other) in compared:
+                    continue
+                compared.add((first, other))
+                root_a, root_b = find(first), find(other)
+                if root_a != root_b and similarity(signatures[first], signatures[other]) >= threshold:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+    
+    clusters = {}
+    for index in range(len(texts)):
+        clusters.setdefault(find(index), []).append(index)
+    return sorted(clusters.values(), key=lambda members: members[0])
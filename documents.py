@@ -0,0 +1,236 @@
+"""
+Optional document-body stage: follows update links and extracts bounded text from HTML and PDF
+"""
+
+import hashlib
+import io
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from bs4 import BeautifulSoup
+from pypdf import PdfReader
+from cache import DiskCache
+from metrics import DOCUMENT_FETCHES, DOCUMENT_SECONDS
+from scraper import HTML_PARSER, HostThrottle
+
+FETCH_DOCUMENTS = os.getenv('FETCH_DOCUMENTS', 'false').lower() == 'true'
+# Bounds per document: bytes downloaded, wall time, PDF pages read and characters kept
+DOCUMENT_MAX_BYTES = int(os.getenv('DOCUMENT_MAX_BYTES', str(5 * 1024 * 1024)))
+DOCUMENT_TIMEOUT = float(os.getenv('DOCUMENT_TIMEOUT', '30'))
+DOCUMENT_MAX_PAGES = int(os.getenv('DOCUMENT_MAX_PAGES', '40'))
+DOCUMENT_MAX_TEXT_CHARS = int(os.getenv('DOCUMENT_MAX_TEXT_CHARS', '50000'))
+DOCUMENT_CHUNK_CHARS = int(os.getenv('DOCUMENT_CHUNK_CHARS', '2000'))
+# Most relevant chunks sent to the LLM per update
+DOCUMENT_PROMPT_CHARS = int(os.getenv('DOCUMENT_PROMPT_CHARS', '8000'))
+# Downloads in flight at once, on top of the per-host throttle
+DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', '2'))
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+# Page furniture that never carries regulatory text
+_BOILERPLATE_TAGS = ['script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside', 'form']
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_SPACES = re.compile(r'[ \t\r\f\v]+')
+
+
+class DocumentTooLarge(Exception):
+    pass
+
+
+def _normalize(text):
+    text = _SPACES.sub(' ', text)
+    return _BLANK_LINES.sub('\n\n', text).strip()
+
+
+def extract_html_text(content, max_chars=DOCUMENT_MAX_TEXT_CHARS):
+    """Readable text of an HTML page, preferring its main/article element; max_chars=None keeps it all"""
+    soup = BeautifulSoup(content, HTML_PARSER)
+    for element in soup(_BOILERPLATE_TAGS):
+        element.decompose()
+    root = soup.find('main') or soup.find('article') or soup.body or soup
+    return _normalize(root.get_text('\n'))[:max_chars]
+
+
+def extract_pdf_text(content, max_chars=DOCUMENT_MAX_TEXT_CHARS, max_pages=DOCUMENT_MAX_PAGES):
+    """Text of a PDF's leading pages, stopping once max_chars (if not None) is reached"""
+    reader = PdfReader(io.BytesIO(content))
+    parts, size = [], 0
+    for page in reader.pages[:max_pages]:
+        text = page.extract_text() or ''
+        parts.append(text)
+        size += len(text)
+        if max_chars is not None and size >= max_chars:
+            break
+    return _normalize('\n\n'.join(parts))[:max_chars]
+
+
+def _split_lines(paragraph, chunk_chars):
+    """Pieces of an oversized paragraph, broken between lines and only cutting lines longer than chunk_chars"""
+    pieces, current = [], ''
+    for line in paragraph.split('\n'):
+        while len(line) > chunk_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:chunk_chars])
+            line = line[chunk_chars:]
+        if current and len(current) + len(line) + 1 > chunk_chars:
+            pieces.append(current)
+            current = ''
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, chunk_chars=DOCUMENT_CHUNK_CHARS):
+    """
+    Split text on paragraph boundaries into chunks of at most chunk_chars. Oversized paragraphs
+    break between lines, so chunk boundaries stay put when unrelated parts of the text change.
+    """
+    chunks, current = [], ''
+    for paragraph in text.split('\n\n'):
+        if len(paragraph) > chunk_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.extend(_split_lines(paragraph, chunk_chars))
+            continue
+        if current and len(current) + len(paragraph) + 2 > chunk_chars:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def excerpt(chunks, max_chars, score=None):
+    """
+    Up to max_chars of a document for the prompt. With score(chunk), the highest-scoring chunks
+    are kept; either way the excerpt is returned in document order.
+    """
+    order = range(len(chunks))
+    if score is not None:
+        order = sorted(order, key=lambda i: score(chunks[i]), reverse=True)
+
+    chosen, size = [], 0
+    for index in order:
+        # Each chunk costs its length plus the blank line joining it to the previous one
+        cost = len(chunks[index]) + (2 if chosen else 0)
+        if size + cost > max_chars:
+            continue
+        chosen.append(index)
+        size += cost
+    return '\n\n'.join(chunks[i] for i in sorted(chosen))
+
+
+class DocumentFetcher:
+    """Downloads and extracts linked documents with bounded size, time and concurrency"""
+
+    def __init__(self, session=None, throttle=None, cache=None, max_workers=DOCUMENT_WORKERS,
+                 max_chars=DOCUMENT_MAX_TEXT_CHARS):
+        self.session = session if session is not None else requests.Session()
+        self.throttle = throttle if throttle is not None else HostThrottle()
+        # "url:<link>" holds validators and the body hash; "text:<hash>" the extracted chunks,
+        # so the same document linked from several updates is extracted once
+        self.cache = cache if cache is not None else DiskCache('documents', max_entries=400,
+                                                              max_age=30 * 86400, autosave=False)
+        self.max_workers = max(1, max_workers)
+        # Characters of text kept per document; None keeps everything within DOCUMENT_MAX_BYTES
+        self.max_chars = max_chars
+        # Untruncated text is cached apart from the truncated text of the same document
+        self._key_prefix = 'full-' if max_chars is None else ''
+
+    def _download(self, url, headers):
+        """Stream the body, giving up past DOCUMENT_MAX_BYTES or DOCUMENT_TIMEOUT"""
+        started = time.monotonic()
+        with self.session.get(url, headers=headers, timeout=(10, DOCUMENT_TIMEOUT), stream=True) as response:
+            if response.status_code == 304:
+                return response, None
+            response.raise_for_status()
+
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > DOCUMENT_MAX_BYTES:
+                raise DocumentTooLarge(f"{declared} bytes")
+
+            body = bytearray()
+            for block in response.iter_content(DOWNLOAD_BLOCK_SIZE):
+                body.extend(block)
+                if len(body) > DOCUMENT_MAX_BYTES:
+                    raise DocumentTooLarge(f"over {DOCUMENT_MAX_BYTES} bytes")
+                if time.monotonic() - started > DOCUMENT_TIMEOUT:
+                    raise requests.Timeout(f"download exceeded {DOCUMENT_TIMEOUT}s")
+            return response, bytes(body)
+
+    def _extract(self, response, body):
+        content_type = response.headers.get('Content-Type', '').lower()
+        if 'pdf' in content_type or body.startswith(b'%PDF'):
+            return extract_pdf_text(body, self.max_chars)
+        if 'html' in content_type or 'xml' in content_type or not content_type:
+            return extract_html_text(body, self.max_chars)
+        return None
+
+    def fetch(self, url):
+        """Extracted text chunks of the document at url, or None if unavailable"""
+        cached = self.cache.get(f"{self._key_prefix}url:{url}")
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        try:
+            with DOCUMENT_SECONDS.time(stage='download'):
+                response, body = self.throttle.run(url, self._download, url, headers)
+        except DocumentTooLarge as e:
+            DOCUMENT_FETCHES.inc(outcome='too_large')
+            print(f"Skipping document {url}: {str(e)}")
+            return None
+        except Exception as e:
+            DOCUMENT_FETCHES.inc(outcome='error')
+            print(f"Error fetching document {url}: {str(e)}")
+            return None
+
+        if body is None:
+            chunks = self.cache.get(f"{self._key_prefix}text:{cached['hash']}") if cached else None
+            if chunks is not None:
+                DOCUMENT_FETCHES.inc(outcome='not_modified')
+                return chunks
+            return None
+
+        content_hash = hashlib.sha256(body).hexdigest()
+        chunks = self.cache.get(f"{self._key_prefix}text:{content_hash}")
+        if chunks is not None:
+            DOCUMENT_FETCHES.inc(outcome='unchanged')
+        else:
+            try:
+                with DOCUMENT_SECONDS.time(stage='extract'):
+                    text = self._extract(response, body)
+            except Exception as e:
+                DOCUMENT_FETCHES.inc(outcome='error')
+                print(f"Error extracting document {url}: {str(e)}")
+                return None
+            if not text:
+                DOCUMENT_FETCHES.inc(outcome='unsupported')
+                return None
+            DOCUMENT_FETCHES.inc(outcome='fetched')
+            chunks = chunk_text(text)
+            self.cache.set(f"{self._key_prefix}text:{content_hash}", chunks)
+
+        self.cache.set(f"{self._key_prefix}url:{url}", {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'hash': content_hash
+        })
+        return chunks
+
+    def fetch_many(self, urls):
+        """Chunks per URL for every distinct link that yielded text; at most max_workers downloads run at once"""
+        urls = list(dict.fromkeys(url for url in urls if url and url.startswith(('http://', 'https://'))))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.fetch, urls))
+        self.cache.flush()
+        return {url: chunks for url, chunks in zip(urls, results) if chunks}
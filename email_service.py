@@ -3,118 +3,262 @@ Email service for daily compliance summaries using SendGrid
 """
 
 import os
+import json
+import random
+import smtplib
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.message import EmailMessage
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from metrics import EMAIL_SECONDS, EMAILS
+from regulatory_sources import REGULATORY_SOURCES
 
 load_dotenv()
 
+# JSON list of {"email", "regulators", "categories"}; empty filters mean everything.
+# Without it the digest goes to EMAIL_ADDRESS only.
+EMAIL_SUBSCRIBERS_FILE = os.getenv('EMAIL_SUBSCRIBERS_FILE', 'subscribers.json')
+# "sendgrid", or "smtp" for a local stand-in such as MailHog or `python -m aiosmtpd -n`
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'sendgrid')
+SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '1025'))
+# Concurrent deliveries, recipients per SendGrid request and retries per delivery
+EMAIL_WORKERS = int(os.getenv('EMAIL_WORKERS', '4'))
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '500'))
+EMAIL_MAX_RETRIES = int(os.getenv('EMAIL_MAX_RETRIES', '3'))
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryableEmailError(Exception):
+    """A transient delivery failure; retry_after is the server's requested delay in seconds, if any"""
+    
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _with_backoff(attempt):
+    """Call attempt() until it stops raising RetryableEmailError, with jittered exponential backoff"""
+    for number in range(EMAIL_MAX_RETRIES + 1):
+        try:
+            return attempt()
+        except RetryableEmailError as e:
+            if number == EMAIL_MAX_RETRIES:
+                raise
+            delay = e.retry_after if e.retry_after is not None else min(30.0, 2 ** number) * random.uniform(0.5, 1.5)
+            time.sleep(delay)
+
+
+def _smtp_transient(error):
+    """True for SMTP failures worth retrying: 4xx replies, dropped connections and socket errors"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # Other SMTPExceptions (e.g. every recipient refused) are permanent; plain OSErrors are network failures
+    return not isinstance(error, smtplib.SMTPException)
+
+
+def _safe_url(url):
+    """Only http(s) links are rendered; anything else becomes '#'"""
+    return url if isinstance(url, str) and url.startswith(('http://', 'https://')) else '#'
+
+
+# Compiled once per process; autoescaping covers titles and LLM output alike
+_templates = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    autoescape=select_autoescape(['html']),
+    trim_blocks=True
+)
+_templates.filters['safe_url'] = _safe_url
+DIGEST_TEMPLATE = _templates.get_template('email_digest.html')
+
+
+def load_subscribers(path=None, default_email=None):
+    """Subscribers from the JSON file, falling back to a single unfiltered default_email"""
+    path = path or EMAIL_SUBSCRIBERS_FILE
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        entries = [{'email': default_email}] if default_email else []
+    except (OSError, ValueError) as e:
+        print(f"Error reading subscribers from {path}: {str(e)}")
+        entries = [{'email': default_email}] if default_email else []
+
+    return [
+        {
+            'email': entry['email'],
+            'regulators': sorted(entry.get('regulators') or []),
+            'categories': sorted(entry.get('categories') or [])
+        }
+        for entry in entries if entry.get('email')
+    ]
+
+
+def _regulator_names(filters):
+    """Accept regulator codes (FinCEN) as well as the display names analyses carry"""
+    return {REGULATORY_SOURCES[f]['name'] if f in REGULATORY_SOURCES else f for f in filters}
+
+
+def filter_updates(analyzed_updates, regulators=(), categories=()):
+    """Analyses matching a subscriber's regulator and category filters"""
+    names = _regulator_names(regulators)
+    wanted = set(categories)
+    selected = []
+    for item in analyzed_updates:
+        if names:
+            reporters = {source['regulator'] for source in item.get('sources') or []} | {item['regulator']}
+            if not names & reporters:
+                continue
+        if wanted and not wanted & set(item.get('categories', [])):
+            continue
+        selected.append(item)
+    return selected
+
+
 class EmailService:
-    def __init__(self):
+    def __init__(self, subscribers=None):
         self.sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
         self.email_address = os.getenv('EMAIL_ADDRESS')
+        self.api_url = os.getenv('SENDGRID_API_URL', "https://api.sendgrid.com/v3/mail/send")
+        self.subscribers = subscribers if subscribers is not None else load_subscribers(default_email=self.email_address)
+        self.max_workers = max(1, EMAIL_WORKERS)
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def render_html_email(self, analyzed_updates):
+        """Render the digest template, yielding HTML one card at a time"""
+        return DIGEST_TEMPLATE.generate(
+            updates=analyzed_updates,
+            date=datetime.now().strftime('%B %d, %Y')
+        )
     
     def create_html_email(self, analyzed_updates):
         """Create formatted HTML email"""
+        return ''.join(self.render_html_email(analyzed_updates))
+    
+    def _digests(self, analyzed_updates):
+        """(recipients, updates) per distinct subscriber filter, so shared digests render once"""
+        groups = {}
+        for subscriber in self.subscribers:
+            key = (tuple(subscriber['regulators']), tuple(subscriber['categories']))
+            groups.setdefault(key, []).append(subscriber['email'])
+        
+        digests = []
+        for (regulators, categories), recipients in groups.items():
+            updates = filter_updates(analyzed_updates, regulators, categories)
+            if updates:
+                digests.append((recipients, updates))
+        return digests
+    
+    def _post_sendgrid(self, recipients, subject, html_body):
+        """One SendGrid request; each recipient gets a separate personalization so addresses stay private"""
+        headers = {
+            "Authorization": f"Bearer {self.sendgrid_api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "personalizations": [
+                {"to": [{"email": recipient}], "subject": subject}
+                for recipient in recipients
+            ],
+            "from": {
+                "email": self.email_address,
+                "name": "AML Compliance Agent"
+            },
+            "content": [
+                {
+                    "type": "text/html",
+                    "value": html_body
+                }
+            ]
+        }
         
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; background-color: #f5f7fa; }}
-                .container {{ max-width: 900px; margin: 0 auto; background: white; }}
-                .header {{ background: linear-gradient(135deg, #1e3a8a 0%, #3b82f6 100%); 
-                          color: white; padding: 30px; }}
-                .update-card {{ border-left: 4px solid #3b82f6; padding: 20px; 
-                              margin: 20px; background: #f8fafc; }}
-                .regulator {{ color: #1e3a8a; font-weight: 600; font-size: 14px; 
-                            text-transform: uppercase; }}
-                .categories {{ margin: 10px 0; }}
-                .category-tag {{ display: inline-block; background: #dbeafe; color: #1e40af; 
-                               padding: 4px 10px; border-radius: 12px; font-size: 11px; 
-                               margin-right: 6px; margin-bottom: 6px; font-weight: 600; }}
-                .title {{ color: #1e40af; font-size: 18px; font-weight: 600; margin: 10px 0; }}
-                .analysis {{ line-height: 1.6; color: #334155; white-space: pre-wrap; }}
-                .link {{ margin-top: 10px; }}
-                .link a {{ color: #3b82f6; text-decoration: none; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>AML/BSA Regulatory Update</h1>
-                    <p>Daily Summary - {datetime.now().strftime('%B %d, %Y')}</p>
-                </div>
-        """
+        def attempt():
+            try:
+                response = self.session.post(self.api_url, json=payload, headers=headers, timeout=10)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                raise RetryableEmailError(str(e))
+            
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                retry_after = response.headers.get('Retry-After')
+                raise RetryableEmailError(f"{response.status_code} - {response.text}",
+                                          float(retry_after) if retry_after and retry_after.isdigit() else None)
+            if response.status_code != 202:
+                raise RuntimeError(f"{response.status_code} - {response.text}")
         
-        if not analyzed_updates:
-            html_content += '<p style="text-align: center; padding: 40px;">No updates today.</p>'
-        else:
-            for item in analyzed_updates:
-                update = item['update']
-                categories = item.get('categories', [])
-                
-                category_tags = ''.join([f'<span class="category-tag">{cat}</span>' for cat in categories])
-                
-                html_content += f"""
-                    <div class="update-card">
-                        <div class="regulator">{item['regulator']}</div>
-                        <div class="categories">{category_tags}</div>
-                        <div class="title">{update.get('title', 'Update')}</div>
-                        <div class="analysis">{item['analysis']}</div>
-                        <div class="link"><a href="{update.get('link', '#')}">View Full Update</a></div>
-                    </div>
-                """
+        _with_backoff(attempt)
+    
+    def _send_smtp(self, recipients, subject, html_body):
+        """Send through a plain SMTP server, one message per recipient; retries resume after the last one accepted"""
+        remaining = list(recipients)
         
-        html_content += """
-            </div>
-        </body>
-        </html>
-        """
+        def attempt():
+            try:
+                with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as smtp:
+                    while remaining:
+                        message = EmailMessage()
+                        message['Subject'] = subject
+                        message['From'] = self.email_address
+                        message['To'] = remaining[0]
+                        message.set_content("This digest is HTML only.")
+                        message.add_alternative(html_body, subtype='html')
+                        smtp.send_message(message)
+                        remaining.pop(0)
+            except OSError as e:
+                if _smtp_transient(e):
+                    raise RetryableEmailError(str(e))
+                raise
         
-        return html_content
+        _with_backoff(attempt)
     
-    def send_daily_summary(self, analyzed_updates):
-        """Send daily summary email using SendGrid"""
+    def _deliver(self, recipients, html_body, subject):
         try:
-            import requests
-            
-            url = "https://api.sendgrid.com/v3/mail/send"
-            
-            headers = {
-                "Authorization": f"Bearer {self.sendgrid_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            html_body = self.create_html_email(analyzed_updates)
-            
-            payload = {
-                "personalizations": [
-                    {
-                        "to": [{"email": self.email_address}],
-                        "subject": f"AML/BSA Compliance Update - {datetime.now().strftime('%B %d, %Y')}"
-                    }
-                ],
-                "from": {
-                    "email": self.email_address,
-                    "name": "AML Compliance Agent"
-                },
-                "content": [
-                    {
-                        "type": "text/html",
-                        "value": html_body
-                    }
-                ]
-            }
-            
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
-            
-            if response.status_code == 202:
-                print(f"✓ Email sent to {self.email_address}")
-                return True
-            else:
-                print(f"✗ Email error: {response.status_code} - {response.text}")
-                return False
-            
+            with EMAIL_SECONDS.time(stage='send'):
+                if EMAIL_BACKEND == 'smtp':
+                    self._send_smtp(recipients, subject, html_body)
+                else:
+                    self._post_sendgrid(recipients, subject, html_body)
+            EMAILS.inc(len(recipients), outcome='sent')
+            return True
         except Exception as e:
-            print(f"✗ Email error: {str(e)}")
+            EMAILS.inc(len(recipients), outcome='failed')
+            print(f"✗ Email error for {len(recipients)} recipients: {str(e)}")
             return False
+    
+    def send_daily_summary(self, analyzed_updates):
+        """Send each subscriber their filtered digest; True if every delivery succeeded"""
+        subject = f"AML/BSA Compliance Update - {datetime.now().strftime('%B %d, %Y')}"
+        
+        # Each digest is rendered once and shared by all of its recipient chunks
+        deliveries, unrendered = [], 0
+        for recipients, updates in self._digests(analyzed_updates):
+            try:
+                with EMAIL_SECONDS.time(stage='render'):
+                    html_body = self.create_html_email(updates)
+            except Exception as e:
+                EMAILS.inc(len(recipients), outcome='failed')
+                print(f"✗ Email render error for {len(recipients)} recipients: {str(e)}")
+                unrendered += len(recipients)
+                continue
+            for start in range(0, len(recipients), EMAIL_BATCH_SIZE):
+                deliveries.append((recipients[start:start + EMAIL_BATCH_SIZE], html_body))
+        if not deliveries and not unrendered:
+            print("No subscribers matched today's updates")
+            return True
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda delivery: self._deliver(*delivery, subject), deliveries))
+        
+        sent = sum(len(recipients) for (recipients, _), ok in zip(deliveries, results) if ok)
+        total = sum(len(recipients) for recipients, _ in deliveries) + unrendered
+        print(f"✓ Email sent to {sent} of {total} subscribers")
+        return all(results) and not unrendered
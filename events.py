@@ -0,0 +1,139 @@
+"""
+Publish/subscribe of scan progress for server-sent event streams, relayed between processes
+through the store
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+HEARTBEAT_SECONDS = 15
+# How often buffered events are written, and how often listening processes check for new ones
+EVENT_POLL_SECONDS = float(os.getenv('EVENT_POLL_SECONDS', '0.5'))
+# Events older than this are pruned when the next scan starts
+EVENT_RETENTION_SECONDS = 3600
+# Written as soon as they are published rather than with the next batch
+_IMMEDIATE_EVENTS = {'scan_started', 'scan_completed', 'scan_failed'}
+
+
+class EventBroker:
+    """Fans published events out to every subscriber's bounded queue"""
+    
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+    
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+    
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+    
+    def publish(self, event, data):
+        """Deliver an event to all subscribers; slow subscribers drop events instead of blocking the scan"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                pass
+    
+    def stream(self):
+        """Generator of SSE-formatted messages for one client, with periodic heartbeats"""
+        subscriber = self.subscribe()
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment lines keep proxies from closing idle connections
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class EventRelay:
+    """
+    Scan events across processes. Only the scan leader scans, but /api/stream can land on any
+    gunicorn worker: publish() appends events to the store (batching the frequent analysis_delta
+    events), and each process with stream subscribers tails the table by id into its own
+    EventBroker.
+    """
+    
+    def __init__(self, store, broker=None, poll_seconds=EVENT_POLL_SECONDS):
+        self.store = store
+        self.broker = broker if broker is not None else EventBroker()
+        self.poll_seconds = poll_seconds
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._threads = {}
+    
+    def _start(self, name, target):
+        with self._lock:
+            if name not in self._threads:
+                self._threads[name] = threading.Thread(target=target, daemon=True, name=f"scan-events-{name}")
+                self._threads[name].start()
+    
+    def publish(self, event, data):
+        """Queue an event for every listening process; never blocks the scan on a failed write"""
+        with self._lock:
+            self._pending.append((event, json.dumps(data)))
+        if event in _IMMEDIATE_EVENTS:
+            self.flush(prune=event == 'scan_started')
+        else:
+            self._start('writer', self._write_loop)
+    
+    def flush(self, prune=False):
+        # One writer at a time keeps events in publish order
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                self.store.append_events(pending, time.time() - EVENT_RETENTION_SECONDS if prune else None)
+            except Exception as e:
+                print(f"✗ Could not record {len(pending)} scan events: {str(e)}")
+    
+    def _write_loop(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            self.flush()
+    
+    def _tail_loop(self):
+        last_id = None
+        while True:
+            if not self.broker.has_subscribers():
+                # Nobody listening: skip the queries, and don't replay old events to the next client
+                last_id = None
+            else:
+                try:
+                    if last_id is None:
+                        last_id = self.store.latest_event_id()
+                    for row in self.store.events_after(last_id):
+                        self.broker.publish(row['event'], json.loads(row['data']))
+                        last_id = row['id']
+                except Exception as e:
+                    print(f"✗ Could not read scan events: {str(e)}")
+            time.sleep(self.poll_seconds)
+    
+    def stream(self):
+        """SSE generator for one client, fed from the store by this process's tail thread"""
+        self._start('tail', self._tail_loop)
+        return self.broker.stream()
@@ -1,26 +1,34 @@
 """
 Gunicorn configuration for background tasks
 """
+import os
 import threading
 
 def post_worker_init(worker):
     """
     Called just after a worker has been initialized.
     """
-    from app import run_daily_scan, schedule_daily_scans
+    from app import warm_caches
     
-    print(f"Worker {worker.pid}: Starting background tasks immediately...")
+    # Serve from stored results straight away; the scan leader queues a startup scan if they are stale
+    try:
+        warm_caches()
+    except Exception as e:
+        print(f"Worker {worker.pid}: Cache warm-up failed: {str(e)}")
     
-    # Start scan immediately (no delay)
-    threading.Thread(target=run_daily_scan, daemon=True).start()
-    
-    # Start scheduler
-    threading.Thread(target=schedule_daily_scans, daemon=True).start()
+    # Set RUN_EMBEDDED_WORKER=false when scans run in a separate `python worker.py` process
+    if os.getenv('RUN_EMBEDDED_WORKER', 'true').lower() == 'true':
+        from worker import work_forever
+        threading.Thread(target=work_forever, daemon=True).start()
     
     print(f"Worker {worker.pid}: Background tasks running")
 
 # Gunicorn config
 bind = "0.0.0.0:10000"
-workers = 1
+# Workers share results through the SQLite store; the scan leader lease keeps scanning to one process
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
 timeout = 300
-worker_class = "sync"
+# Threaded worker so long-lived /api/stream connections don't block other requests; each open
+# stream holds a thread, and the dashboard only connects while a scan is in progress
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
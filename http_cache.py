@@ -0,0 +1,118 @@
+"""
+Conditional, compressed JSON responses cached per scan version
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+class ResponseCache:
+    """Serialized and compressed JSON bodies keyed by request, valid until the scan version changes"""
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version:
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, version, key, entry):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _preferred_encoding():
+    """Best content coding the client accepts that we can produce"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _etag(digest, encoding):
+    """Each content coding is a different representation, so it gets its own strong ETag"""
+    return f"{digest}-{encoding}" if encoding else digest
+
+
+def _not_modified(tag):
+    # If-None-Match uses weak comparison, so W/ copies of our tags and "*" match too
+    return request.if_none_match.contains_weak(tag)
+
+
+def cached_json_response(cache, version, build):
+    """
+    Serve build()'s JSON for the current request with a strong ETag tied to version and encoding.
+    
+    If-None-Match hits return 304 without calling build() where the cached entry (or a compressed
+    tag) settles which encoding would be served; misses are serialized once per request key and
+    version, then reused (and compressed per encoding) until the version changes.
+    """
+    key = request.full_path
+    digest = hashlib.sha256(f"{version}\n{key}".encode('utf-8')).hexdigest()[:32]
+    headers = {
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding'
+    }
+    
+    encoding = _preferred_encoding()
+    entry = cache.get(version, key)
+    # Only a body big enough to compress was ever sent under a compressed tag
+    if entry is None and encoding and _not_modified(_etag(digest, encoding)):
+        headers['ETag'] = f'"{_etag(digest, encoding)}"'
+        return Response(status=304, headers=headers)
+    
+    if entry is None:
+        payload, status = build()
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        if status != 200:
+            return Response(body, status=status, mimetype='application/json')
+        entry = {'identity': body}
+        cache.put(version, key, entry)
+    
+    body = entry['identity']
+    if len(body) < MIN_COMPRESS_SIZE:
+        encoding = None
+    headers['ETag'] = f'"{_etag(digest, encoding)}"'
+    if _not_modified(_etag(digest, encoding)):
+        return Response(status=304, headers=headers)
+    
+    if encoding:
+        if encoding not in entry:
+            entry[encoding] = _compress(body, encoding)
+        body = entry[encoding]
+        headers['Content-Encoding'] = encoding
+    
+    return Response(body, status=200, mimetype='application/json', headers=headers)
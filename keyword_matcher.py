@@ -0,0 +1,40 @@
+"""
+Single-pass multi-keyword matching with word boundaries
+"""
+
+import re
+
+
+class KeywordMatcher:
+    """Compiles {label: [keywords]} into one case-insensitive regex matched in a single scan"""
+    
+    def __init__(self, keywords_by_label):
+        self.labels = list(keywords_by_label)
+        self._labels_by_keyword = {}
+        for label, keywords in keywords_by_label.items():
+            for keyword in keywords:
+                self._labels_by_keyword.setdefault(keyword.lower(), []).append(label)
+        
+        # Longest first so "suspicious activity report" wins over any shorter overlapping keyword
+        alternatives = sorted(self._labels_by_keyword, key=len, reverse=True)
+        # Lookarounds rather than \b so keywords starting with symbols like "$10,000" still anchor;
+        # an optional plural "s" keeps "SARs" and "CTRs" matching while "necessary" does not
+        self.pattern = re.compile(
+            r'(?<!\w)(' + '|'.join(re.escape(k) for k in alternatives) + r')s?(?!\w)',
+            re.IGNORECASE
+        )
+    
+    def finditer(self, text):
+        """Yield (keyword, labels, start, end) for each non-overlapping match in text"""
+        for match in self.pattern.finditer(text):
+            keyword = match.group(1).lower()
+            yield keyword, self._labels_by_keyword[keyword], match.start(), match.end()
+    
+    def matched_labels(self, text):
+        """Labels with at least one keyword in text, in the order they were configured"""
+        found = set()
+        for _, labels, _, _ in self.finditer(text):
+            found.update(labels)
+            if len(found) == len(self.labels):
+                break
+        return [label for label in self.labels if label in found]
@@ -0,0 +1,233 @@
+"""
+Chat-completions backends for the analyzer: pooled OpenAI-compatible endpoints, per-category
+model routing and record/replay of responses for deterministic offline runs
+"""
+
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from cache import CACHE_DIR
+from metrics import LLM_REPLAYS, LLM_REQUESTS
+from rate_limit import TokenBucket
+from regulatory_sources import REGULATORY_SOURCES
+
+load_dotenv()
+
+# Default endpoint and model; any OpenAI-compatible server works, including a local stand-in
+LLM_API_URL = os.getenv('VENICE_API_URL', "https://api.venice.ai/api/v1/chat/completions")
+LLM_MODEL = os.getenv('LLM_MODEL', 'llama-3.3-70b')
+# JSON object mapping a regulation category to {"model", "url", "api_key_env"}; missing keys use
+# the defaults. An item takes the route of its first detected category that has one.
+LLM_CATEGORY_ROUTES = json.loads(os.getenv('LLM_CATEGORY_ROUTES') or '{}')
+# Cheaper or faster model (and optional endpoint) for the regulators in LLM_LOW_PRIORITY_REGULATORS
+LLM_FALLBACK_MODEL = os.getenv('LLM_FALLBACK_MODEL', '')
+LLM_FALLBACK_URL = os.getenv('LLM_FALLBACK_URL', '')
+LLM_LOW_PRIORITY_REGULATORS = [code.strip() for code in os.getenv('LLM_LOW_PRIORITY_REGULATORS', '').split(',') if code.strip()]
+# "live"; "record", which replays saved responses and saves new ones; or "replay", which never
+# touches the network and fails requests without a saved response
+LLM_MODE = os.getenv('LLM_MODE', 'live')
+LLM_REPLAY_DIR = os.getenv('LLM_REPLAY_DIR', os.path.join(CACHE_DIR, 'llm_replay'))
+
+# Client-side limits and retries, per endpoint and API key
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', '60'))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '100000'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ChatCompletionsBackend:
+    """One chat-completions endpoint: a keep-alive connection pool, rate limits and retries"""
+
+    def __init__(self, url, api_key, max_connections=4):
+        self.url = url
+        self.api_key = api_key
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_connections))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+        self.token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE)
+
+    def _estimate_tokens(self, payload):
+        """Rough token count (~4 chars per token) of prompt plus the completion budget"""
+        prompt_chars = sum(len(m['content']) for m in payload['messages'])
+        return prompt_chars // 4 + payload.get('max_tokens', 0)
+
+    def _post(self, payload, retry_timeouts=True):
+        """
+        POST within rate limits, retrying 429/5xx with jittered backoff. Read timeouts are only
+        retried with retry_timeouts: the provider may still generate (and bill) the abandoned
+        completion. Returns the response unread so streamed completions can be consumed incrementally.
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        estimated_tokens = self._estimate_tokens(payload)
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self.request_bucket.acquire()
+            self.token_bucket.acquire(estimated_tokens)
+
+            try:
+                response = self.session.post(self.url, json=payload, headers=headers,
+                                             timeout=30, stream=payload.get('stream', False))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                LLM_REQUESTS.inc(status='connection_error')
+                read_timeout = isinstance(e, requests.Timeout) and not isinstance(e, requests.ConnectTimeout)
+                if attempt == LLM_MAX_RETRIES or (read_timeout and not retry_timeouts):
+                    raise
+                response = None
+            else:
+                LLM_REQUESTS.inc(status=response.status_code)
+
+            if response is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+                return response
+
+            if attempt == LLM_MAX_RETRIES:
+                response.raise_for_status()
+
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+            time.sleep(delay)
+
+    def _read(self, response, on_token=None):
+        """Collect completion text from a server-sent event stream, reporting each delta to on_token"""
+        with response:
+            # Endpoints that ignore "stream" answer with a single JSON body
+            if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                body = response.json()
+                content = body['choices'][0]['message']['content']
+                if on_token:
+                    on_token(content)
+                return content, body.get('usage')
+
+            parts = []
+            usage = None
+            for line in response.iter_lines():
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get('usage') or usage
+                choices = chunk.get('choices') or []
+                delta = choices[0].get('delta', {}).get('content') if choices else None
+                if delta:
+                    parts.append(delta)
+                    if on_token:
+                        on_token(delta)
+            return ''.join(parts), usage
+
+    def complete(self, payload, on_token=None, retry_timeouts=True):
+        """(text, usage) for a completion request; usage is None when the API reports none"""
+        return self._read(self._post(payload, retry_timeouts), on_token)
+
+
+class ReplayBackend:
+    """Serves saved responses by request hash; when recording, fills misses from a live backend"""
+
+    def __init__(self, backend=None, directory=LLM_REPLAY_DIR, record=False):
+        self.backend = backend
+        self.directory = directory
+        self.record = record
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def request_key(payload):
+        """Hash of everything that shapes the completion; streaming or not makes no difference"""
+        material = {key: value for key, value in payload.items() if key != 'stream'}
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _save(self, path, text, usage):
+        """Write atomically so concurrent workers never read a partial response"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'text': text, 'usage': usage}, f)
+        os.replace(tmp_path, path)
+
+    def complete(self, payload, on_token=None, retry_timeouts=True):
+        key = self.request_key(payload)
+        path = os.path.join(self.directory, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            if not self.record:
+                LLM_REPLAYS.inc(result='miss')
+                raise LookupError(f"no recorded response for request {key[:12]} in {self.directory}")
+            text, usage = self.backend.complete(payload, on_token, retry_timeouts)
+            self._save(path, text, usage)
+            LLM_REPLAYS.inc(result='recorded')
+            return text, usage
+
+        LLM_REPLAYS.inc(result='hit')
+        if on_token:
+            on_token(saved['text'])
+        return saved['text'], saved.get('usage')
+
+
+class LLMRoute:
+    """A model served by a backend"""
+
+    def __init__(self, backend, model):
+        self.backend = backend
+        self.model = model
+
+    @property
+    def key(self):
+        """Items with equal keys can share a batched request"""
+        return (id(self.backend), self.model)
+
+
+class LLMRouter:
+    """Picks the backend and model for an item from its regulator and detected categories"""
+
+    def __init__(self, max_connections=4, mode=LLM_MODE):
+        if mode not in ('live', 'record', 'replay'):
+            raise ValueError(f"LLM_MODE must be live, record or replay, got {mode!r}")
+        self.max_connections = max_connections
+        self.mode = mode
+        # Routes on the same endpoint and key share one connection pool and one set of rate limits
+        self._backends = {}
+
+        self.default = self._route(LLM_MODEL)
+        self.category_routes = {
+            category: self._route(config.get('model', LLM_MODEL), config.get('url'), config.get('api_key_env'))
+            for category, config in LLM_CATEGORY_ROUTES.items()
+        }
+        self.fallback = self._route(LLM_FALLBACK_MODEL, LLM_FALLBACK_URL) if LLM_FALLBACK_MODEL else None
+        # Codes are accepted as well as the display names analyses carry
+        self.low_priority = {
+            REGULATORY_SOURCES[r]['name'] if r in REGULATORY_SOURCES else r for r in LLM_LOW_PRIORITY_REGULATORS
+        }
+
+    def _route(self, model, url=None, api_key_env=None):
+        url = url or LLM_API_URL
+        api_key_env = api_key_env or 'VENICE_API_KEY'
+        backend = self._backends.get((url, api_key_env))
+        if backend is None:
+            backend = None if self.mode == 'replay' else ChatCompletionsBackend(url, os.getenv(api_key_env), self.max_connections)
+            if self.mode != 'live':
+                backend = ReplayBackend(backend, record=self.mode == 'record')
+            self._backends[(url, api_key_env)] = backend
+        return LLMRoute(backend, model)
+
+    def route(self, regulator, categories):
+        if self.fallback is not None and regulator in self.low_priority:
+            return self.fallback
+        for category in categories:
+            if category in self.category_routes:
+                return self.category_routes[category]
+        return self.default
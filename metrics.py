@@ -0,0 +1,200 @@
+"""
+Process-local counters and latency histograms with Prometheus text exposition and per-scan reports
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, covering fast cache hits through slow LLM completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic total per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        for key, value in sorted(self.snapshot().items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label combination"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][index] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {'sum': entry['sum'], 'count': entry['count']} for key, entry in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(entry['buckets']), entry['sum'], entry['count'])
+                      for key, entry in self._values.items()}
+        for key, (buckets, total, count) in sorted(values.items()):
+            pairs = list(zip(self.labelnames, key))
+            for bound, cumulative in zip(self.buckets, buckets):
+                yield f"{self.name}_bucket", pairs + [('le', _format_value(bound))], cumulative
+            yield f"{self.name}_bucket", pairs + [('le', '+Inf')], count
+            yield f"{self.name}_sum", pairs, total
+            yield f"{self.name}_count", pairs, count
+
+
+class Registry:
+    """All metrics of this process, in registration order"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, pairs, value in metric.samples():
+                lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Current values of every metric, for diffing with report()"""
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def report(self, before):
+        """
+        What changed since the snapshot before, as JSON-friendly data: counters map
+        "label=value,..." to their increase, histograms to {"count", "seconds"}.
+        """
+        report = {}
+        for metric in self._metrics:
+            previous = before.get(metric.name, {})
+            changes = {}
+            for key, value in metric.snapshot().items():
+                label = ','.join(f"{n}={v}" for n, v in zip(metric.labelnames, key)) or 'total'
+                if metric.kind == 'histogram':
+                    old = previous.get(key, {'sum': 0.0, 'count': 0})
+                    if value['count'] > old['count']:
+                        changes[label] = {'count': value['count'] - old['count'],
+                                          'seconds': round(value['sum'] - old['sum'], 4)}
+                elif value > previous.get(key, 0):
+                    changes[label] = value - previous.get(key, 0)
+            if changes:
+                report[metric.name] = changes
+        return report
+
+
+REGISTRY = Registry()
+
+SCAN_STAGE_SECONDS = REGISTRY.histogram(
+    'aml_scan_stage_seconds', 'Wall time of each scan stage', ['stage'])
+SCANS = REGISTRY.counter(
+    'aml_scans_total', 'Scans run by this process', ['status'])
+FETCH_SECONDS = REGISTRY.histogram(
+    'aml_fetch_seconds', 'Source download time, excluding per-host throttle waits', ['kind'])
+FETCH_RESULTS = REGISTRY.counter(
+    'aml_fetch_results_total',
+    'Source fetch outcomes: fetched, not_modified (304), unchanged (same body hash) or error', ['kind', 'outcome'])
+THROTTLE_WAIT_SECONDS = REGISTRY.histogram(
+    'aml_throttle_wait_seconds', 'Time spent waiting for a per-host request slot')
+PARSE_SECONDS = REGISTRY.histogram(
+    'aml_parse_seconds', 'Feed and listing parse time', ['kind'])
+ANALYSIS_CACHE = REGISTRY.counter(
+    'aml_analysis_cache_total', 'Analysis cache lookups', ['result'])
+LLM_SECONDS = REGISTRY.histogram(
+    'aml_llm_seconds', 'Completion time of uncached analyses, including retries and rate-limit waits')
+LLM_REQUESTS = REGISTRY.counter(
+    'aml_llm_requests_total', 'Completion requests by HTTP status, or "connection_error"', ['status'])
+LLM_TOKENS = REGISTRY.counter(
+    'aml_llm_tokens_total', 'Tokens used, as reported by the API or estimated at ~4 characters per token', ['kind'])
+LLM_REPLAYS = REGISTRY.counter(
+    'aml_llm_replay_total', 'Record/replay lookups (LLM_MODE): hit, miss or recorded', ['result'])
+BATCH_ITEMS = REGISTRY.counter(
+    'aml_batch_items_total', 'Items sent in batched analysis requests: parsed, or fallback to a single call', ['result'])
+ANALYSIS_ERRORS = REGISTRY.counter(
+    'aml_analysis_errors_total', 'Analyses that failed and were replaced by a placeholder')
+DOCUMENT_SECONDS = REGISTRY.histogram(
+    'aml_document_seconds', 'Linked document download and text extraction time', ['stage'])
+DOCUMENT_FETCHES = REGISTRY.counter(
+    'aml_document_fetches_total',
+    'Linked document outcomes: fetched, not_modified, unchanged, too_large, unsupported or error', ['outcome'])
+SNAPSHOTS = REGISTRY.counter(
+    'aml_snapshots_total', 'Living document checks: baseline (first snapshot), unchanged or changed', ['outcome'])
+EMAIL_SECONDS = REGISTRY.histogram(
+    'aml_email_seconds', 'Email render and send time', ['stage'])
+EMAILS = REGISTRY.counter(
+    'aml_emails_total', 'Summary email outcomes', ['outcome'])
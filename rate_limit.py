@@ -0,0 +1,35 @@
+"""
+Thread-safe token bucket rate limiting for outbound API calls
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most capacity tokens"""
+    
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def acquire(self, amount=1):
+        """Block until amount tokens are available, then consume them"""
+        # Requests larger than the bucket would never fit, so cap them at a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
@@ -144,3 +144,67 @@ REGULATION_CATEGORIES = {
     "SANCTIONS": "OFAC Sanctions",
     "DIGITAL_ASSETS": "Cryptocurrency/Digital Assets"
 }
+
+
+# CSS selectors for HTML listing pages under "urls", used where regulators publish no RSS feed.
+# "container" is a tag name; only that part of the page is parsed. "item" selects one entry
+# within it, and "link", "title", "date" and "summary" are looked up inside each item
+# ("link" defaults to the first anchor, "title" to the link text).
+LISTING_SELECTORS = {
+    "https://www.fatf-gafi.org/en/publications.html": {
+        "container": "main",
+        "item": ".cmp-list__item, .faceted-search-result, article",
+        "link": "a[href]",
+        "date": "time, .cmp-list__item-date, .date",
+        "summary": "p"
+    },
+    "https://www.fatf-gafi.org/en/topics/virtual-assets.html": {
+        "container": "main",
+        "item": ".cmp-list__item, article",
+        "link": "a[href]",
+        "date": "time, .cmp-list__item-date, .date",
+        "summary": "p"
+    },
+    "https://www.wolfsberg-principles.com/articles": {
+        "container": "main",
+        "item": ".views-row, article",
+        "link": "a[href]",
+        "title": "h2, h3",
+        "date": "time, .date",
+        "summary": ".field--name-body, p"
+    },
+    "https://www.amla.europa.eu/news": {
+        "container": "main",
+        "item": ".ecl-content-item, article, .views-row",
+        "link": "a[href]",
+        "title": ".ecl-content-block__title, h2, h3",
+        "date": "time, .ecl-content-block__primary-meta-item",
+        "summary": ".ecl-content-block__description, p"
+    },
+    "https://www.ffiec.gov/press/press_releases.htm": {
+        # Releases are table rows; navigation menus are lists elsewhere on the page
+        "container": "table",
+        "item": "tr",
+        "link": "a[href]",
+        "date": "td:first-child, .date"
+    }
+}
+
+# Pages under "urls" that are living documents rather than listings. Each scan snapshots their
+# text and analyzes only the sections that changed since the previous snapshot (see snapshots.py).
+LIVING_DOCUMENTS = {
+    "https://www.finra.org/rules-guidance/rulebooks/finra-rules": "FINRA Rulebook",
+    "https://www.occ.gov/topics/supervision-and-examination/bsa/index-bsa.html": "OCC Bank Secrecy Act (BSA) supervision page",
+    "https://bsaaml.ffiec.gov/manual": "FFIEC BSA/AML Examination Manual"
+}
+
+# Federal Register agency slugs, used by the backfill command to walk a regulator's
+# publications by date range (feeds only expose their most recent entries)
+FEDERAL_REGISTER_AGENCIES = {
+    "FinCEN": "financial-crimes-enforcement-network",
+    "OFAC": "foreign-assets-control-office",
+    "FRB": "federal-reserve-system",
+    "FDIC": "federal-deposit-insurance-corporation",
+    "OCC": "comptroller-of-the-currency",
+    "SEC": "securities-and-exchange-commission"
+}
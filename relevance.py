@@ -0,0 +1,57 @@
+"""
+Cheap local relevance scoring used to spend the LLM budget on AML-relevant updates
+"""
+
+import math
+import os
+from keyword_matcher import KeywordMatcher
+
+RELEVANCE_THRESHOLD = float(os.getenv('RELEVANCE_THRESHOLD', '1.0'))
+ANALYSIS_TOP_K = int(os.getenv('ANALYSIS_TOP_K', '30'))
+
+# Generic AML vocabulary that signals relevance without implying a specific category
+AML_KEYWORDS = [
+    "money laundering", "anti-money laundering", "aml", "aml/cft", "terrorist financing",
+    "countering the financing of terrorism", "financial crime", "illicit finance", "kyc",
+    "know your customer", "due diligence", "correspondent banking", "shell company",
+    "proliferation financing", "fraud", "politically exposed"
+]
+
+# Matches in the title count more than matches in the summary
+TITLE_WEIGHT = 2.0
+
+
+class RelevanceScorer:
+    """TF-IDF style keyword scoring over title and summary, with IDF taken from the scored batch"""
+    
+    def __init__(self, category_keywords):
+        keywords = dict(category_keywords)
+        keywords['AML'] = AML_KEYWORDS
+        self.matcher = KeywordMatcher(keywords)
+    
+    def _term_counts(self, title, summary):
+        counts = {}
+        for text, weight in ((title, TITLE_WEIGHT), (summary, 1.0)):
+            for keyword, _, _, _ in self.matcher.finditer(text):
+                counts[keyword] = counts.get(keyword, 0) + weight
+        return counts
+    
+    def score(self, documents):
+        """Scores for (title, summary) pairs; 0 means no AML keyword matched at all"""
+        term_counts = [self._term_counts(title, summary) for title, summary in documents]
+        
+        document_frequency = {}
+        for counts in term_counts:
+            for keyword in counts:
+                document_frequency[keyword] = document_frequency.get(keyword, 0) + 1
+        
+        total = len(documents)
+        scores = []
+        for counts in term_counts:
+            score = 0.0
+            for keyword, count in counts.items():
+                # Smoothed IDF stays >= 1, so any match clears the default threshold
+                idf = math.log((total + 1) / (document_frequency[keyword] + 1)) + 1
+                score += (1 + math.log(count)) * idf
+            scores.append(score)
+        return scores
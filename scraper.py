@@ -2,55 +2,341 @@
 Web scraping module for regulatory sources
 """
 
+import os
+import hashlib
 import requests
 import feedparser
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlparse
+import threading
 import time
+from cache import DiskCache
+from metrics import FETCH_SECONDS, FETCH_RESULTS, PARSE_SECONDS, THROTTLE_WAIT_SECONDS
+from regulatory_sources import LISTING_SELECTORS
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Global cap on simultaneous outbound fetches across all regulators
+SCAN_MAX_WORKERS = int(os.getenv('SCAN_MAX_WORKERS', '8'))
+# Politeness limits applied per host instead of global sleeps
+HOST_MAX_CONCURRENCY = int(os.getenv('HOST_MAX_CONCURRENCY', '1'))
+HOST_MIN_INTERVAL = float(os.getenv('HOST_MIN_INTERVAL', '1.0'))
+FEED_TIMEOUT = int(os.getenv('FEED_TIMEOUT', '20'))
+# Upper bound on GUIDs remembered per feed for incremental scanning
+SEEN_GUIDS_PER_FEED = 200
+# Date formats seen on regulator listing pages
+LISTING_DATE_FORMATS = ['%Y-%m-%d', '%d %B %Y', '%B %d, %Y', '%b %d, %Y', '%d %b %Y', '%m/%d/%Y']
+
+
+class HostThrottle:
+    """Limits concurrency and request spacing per host"""
+    
+    def __init__(self, max_concurrency=HOST_MAX_CONCURRENCY, min_interval=HOST_MIN_INTERVAL):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_interval = max(0.0, min_interval)
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+    
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrency)
+            return self._semaphores[host]
+    
+    def _reserve_slot(self, host):
+        """Reserve the next start time for a host and return how long to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = start + self.min_interval
+            return start - now
+    
+    def run(self, url, func, *args, **kwargs):
+        """Call func once the host of url is allowed another request"""
+        host = urlparse(url).netloc
+        with self._semaphore(host):
+            delay = self._reserve_slot(host)
+            THROTTLE_WAIT_SECONDS.observe(max(0.0, delay))
+            if delay > 0:
+                time.sleep(delay)
+            return func(*args, **kwargs)
+
 
 class RegulatoryScraper:
-    def __init__(self):
+    def __init__(self, max_workers=SCAN_MAX_WORKERS, throttle=None, feed_cache=None, mark_store=None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         }
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        self.max_workers = max(1, max_workers)
+        self.throttle = throttle if throttle is not None else HostThrottle()
+        # ETag/Last-Modified validators plus parsed entries, keyed by feed URL
+        self.feed_cache = feed_cache if feed_cache is not None else DiskCache('feeds', max_entries=500)
+        # Body hash plus extracted items per listing page, so unchanged pages skip parsing
+        self.listing_cache = DiskCache('listings', max_entries=500)
+        # With a mark store, each feed only yields entries newer than its persisted high-water mark
+        self.mark_store = mark_store
+        self.pending_marks = {}
+        # GUIDs cut by the per-regulator cap in _dedupe; like failed analyses they stay unseen
+        self.deferred_guids = set()
+        self._marks_lock = threading.Lock()
     
-    def fetch_rss_feed(self, feed_url):
-        """Fetch and parse RSS feed"""
+    def _parse_feed(self, content, limit=10):
+        """Entries of an RSS/Atom document, newest first as published; limit=None keeps all"""
+        feed = feedparser.parse(content)
+        entries = []
+        for entry in feed.entries[:limit]:
+            pub_date = entry.get('published_parsed') or entry.get('updated_parsed')
+            entries.append({
+                'guid': entry.get('id') or entry.get('link') or entry.get('title', ''),
+                'title': entry.get('title', 'No title'),
+                'link': entry.get('link', ''),
+                'summary': entry.get('summary', '')[:500],
+                'date': entry.get('published', entry.get('updated', 'Recent')),
+                'published': datetime(*pub_date[:6]).isoformat() if pub_date else None
+            })
+        return entries
+    
+    def _download_feed(self, feed_url):
+        """Fetch feed entries, using a conditional request against the on-disk cache"""
+        cached = self.feed_cache.get(feed_url)
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        
+        with FETCH_SECONDS.time(kind='rss'):
+            response = self.session.get(feed_url, headers=headers, timeout=FEED_TIMEOUT)
+        
+        if response.status_code == 304 and cached:
+            FETCH_RESULTS.inc(kind='rss', outcome='not_modified')
+            return cached['entries']
+        
+        response.raise_for_status()
+        FETCH_RESULTS.inc(kind='rss', outcome='fetched')
+        
+        parse_started = time.perf_counter()
+        entries = self._parse_feed(response.content)
+        PARSE_SECONDS.observe(time.perf_counter() - parse_started, kind='rss')
+        
+        if response.headers.get('ETag') or response.headers.get('Last-Modified'):
+            self.feed_cache.set(feed_url, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'entries': entries
+            })
+        
+        return entries
+    
+    def _parse_listing_date(self, element):
+        """Best-effort ISO date from a listing item's date element"""
+        if element is None:
+            return None
+        text = element.get('datetime') or element.get_text(' ', strip=True)
         try:
-            feed = feedparser.parse(feed_url)
-            updates = []
-            cutoff_date = datetime.now() - timedelta(days=30)
+            return datetime.fromisoformat(text[:19]).isoformat()
+        except ValueError:
+            pass
+        for fmt in LISTING_DATE_FORMATS:
+            try:
+                return datetime.strptime(text, fmt).isoformat()
+            except ValueError:
+                continue
+        return None
+    
+    def _download_listing(self, page_url, selectors):
+        """Fetch an HTML listing page and extract its items, skipping the parse if the page is unchanged"""
+        cached = self.listing_cache.get(page_url)
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        
+        with FETCH_SECONDS.time(kind='listing'):
+            response = self.session.get(page_url, headers=headers, timeout=FEED_TIMEOUT)
+        if response.status_code == 304 and cached:
+            FETCH_RESULTS.inc(kind='listing', outcome='not_modified')
+            return cached['entries']
+        response.raise_for_status()
+        
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if cached and cached.get('hash') == content_hash:
+            FETCH_RESULTS.inc(kind='listing', outcome='unchanged')
+            return cached['entries']
+        FETCH_RESULTS.inc(kind='listing', outcome='fetched')
+        
+        parse_started = time.perf_counter()
+        entries = self._parse_listing(response.content, page_url, selectors)
+        PARSE_SECONDS.observe(time.perf_counter() - parse_started, kind='listing')
+        
+        self.listing_cache.set(page_url, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'hash': content_hash,
+            'entries': entries
+        })
+        return entries
+    
+    def _parse_listing(self, content, page_url, selectors, limit=10):
+        """Items of a listing page in page order; limit=None keeps all"""
+        # Only build the tree for the listing container instead of the whole page
+        strainer = SoupStrainer(selectors['container']) if selectors.get('container') else None
+        soup = BeautifulSoup(content, HTML_PARSER, parse_only=strainer)
+        
+        entries = []
+        for item in soup.select(selectors['item']):
+            anchor = item.select_one(selectors.get('link', 'a[href]'))
+            if anchor is None or not anchor.get('href'):
+                continue
+            title_element = item.select_one(selectors['title']) if selectors.get('title') else anchor
+            summary_element = item.select_one(selectors['summary']) if selectors.get('summary') else None
+            date_element = item.select_one(selectors['date']) if selectors.get('date') else None
+            link = urljoin(page_url, anchor['href'])
+            
+            entries.append({
+                'guid': link,
+                'title': (title_element or anchor).get_text(' ', strip=True) or 'No title',
+                'link': link,
+                'summary': summary_element.get_text(' ', strip=True)[:500] if summary_element else '',
+                'date': date_element.get_text(' ', strip=True) if date_element else 'Recent',
+                'published': self._parse_listing_date(date_element)
+            })
+            if limit is not None and len(entries) >= limit:
+                break
+        return entries
+    
+    def _select_new(self, source_url, entries):
+        """Apply the 30-day cutoff and the source's high-water mark to fetched entries"""
+        updates = []
+        cutoff_date = datetime.now() - timedelta(days=30)
+        
+        high_water, seen_guids = None, set()
+        if self.mark_store is not None:
+            high_water, seen_guids = self.mark_store.get_feed_mark(source_url)
+        selected, selected_guids = [], set()
+        
+        for entry in entries:
+            # Entries cached before GUIDs were recorded fall back to the link
+            guid = entry.get('guid') or entry['link'] or entry['title']
+            if guid in seen_guids or guid in selected_guids:
+                continue
             
-            for entry in feed.entries[:10]:
-                pub_date = entry.get('published_parsed') or entry.get('updated_parsed')
-                if pub_date:
-                    entry_date = datetime(*pub_date[:6])
-                    if entry_date < cutoff_date:
-                        continue
-                
-                updates.append({
-                    'title': entry.get('title', 'No title'),
-                    'link': entry.get('link', ''),
-                    'summary': entry.get('summary', '')[:500],
-                    'date': entry.get('published', entry.get('updated', 'Recent'))
-                })
+            if entry['published']:
+                entry_date = datetime.fromisoformat(entry['published'])
+                if entry_date < cutoff_date:
+                    continue
+                if high_water and entry['published'] < high_water:
+                    continue
             
-            return updates
+            updates.append({
+                'guid': guid,
+                'title': entry['title'],
+                'link': entry['link'],
+                'summary': entry['summary'],
+                'date': entry['date'],
+                'published': entry['published']
+            })
+            selected.append((guid, entry['published']))
+            selected_guids.add(guid)
+        
+        if self.mark_store is not None and updates:
+            # The new mark depends on how the analyses turn out; see commit_feed_marks
+            with self._marks_lock:
+                self.pending_marks[source_url] = {
+                    'high_water': high_water,
+                    'seen': seen_guids,
+                    'current': [e.get('guid') or e['link'] or e['title'] for e in entries],
+                    'selected': selected
+                }
+        
+        return updates
+    
+    def fetch_rss_feed(self, feed_url):
+        """Fetch and parse RSS feed, returning only entries past the feed's high-water mark"""
+        try:
+            entries = self.throttle.run(feed_url, self._download_feed, feed_url)
+            return self._select_new(feed_url, entries)
         except Exception as e:
+            FETCH_RESULTS.inc(kind='rss', outcome='error')
             print(f"Error fetching RSS feed {feed_url}: {str(e)}")
             return []
     
-    def fetch_regulator_updates(self, regulator_config):
-        """Fetch all updates for a specific regulator"""
-        all_updates = []
-        
-        for feed_url in regulator_config.get('rss_feeds', []):
-            updates = self.fetch_rss_feed(feed_url)
-            all_updates.extend(updates)
-            time.sleep(1)
+    def fetch_listing_page(self, page_url, selectors):
+        """Fetch an HTML listing page, returning only items past the page's high-water mark"""
+        try:
+            entries = self.throttle.run(page_url, self._download_listing, page_url, selectors)
+            return self._select_new(page_url, entries)
+        except Exception as e:
+            FETCH_RESULTS.inc(kind='listing', outcome='error')
+            print(f"Error fetching listing page {page_url}: {str(e)}")
+            return []
+    
+    def fetch_all_entries(self, kind, url):
+        """Every entry a feed or listing page currently shows, uncached and without date or mark filtering"""
+        response = self.throttle.run(url, self.session.get, url, timeout=FEED_TIMEOUT)
+        response.raise_for_status()
+        if kind == 'listing':
+            return self._parse_listing(response.content, url, LISTING_SELECTORS[url], limit=None)
+        return self._parse_feed(response.content, limit=None)
+    
+    def _fetch_source(self, kind, url):
+        if kind == 'listing':
+            return self.fetch_listing_page(url, LISTING_SELECTORS[url])
+        return self.fetch_rss_feed(url)
+    
+    def _source_jobs(self, regulator_config):
+        """(kind, url) pairs for a regulator's feeds and configured listing pages"""
+        jobs = [('rss', feed_url) for feed_url in regulator_config.get('rss_feeds', [])]
+        jobs += [('listing', url) for url in regulator_config.get('urls', []) if url in LISTING_SELECTORS]
+        return jobs
+    
+    def commit_feed_marks(self, retry=()):
+        """
+        Persist high-water marks once the fetched updates have been processed. Updates in retry
+        (failed or deferred analyses) and those cut by the per-regulator cap are not marked seen,
+        and the mark never moves past them, so the next scan offers them again.
+        """
+        if self.mark_store is None:
+            return
+        with self._marks_lock:
+            pending, self.pending_marks = self.pending_marks, {}
+            unsettled = self.deferred_guids | {update.get('guid') for update in retry}
+            self.deferred_guids = set()
         
+        marks = {}
+        for source_url, mark in pending.items():
+            high_water, seen = mark['high_water'], set(mark['seen'])
+            held = []
+            for guid, published in mark['selected']:
+                if guid in unsettled:
+                    if published:
+                        held.append(published)
+                    continue
+                seen.add(guid)
+                if published and (not high_water or published > high_water):
+                    high_water = published
+            if held and high_water and min(held) < high_water:
+                high_water = min(held)
+            # Entries that dropped off the feed can't reappear, so only remember those still listed
+            kept = [g for g in mark['current'] if g in seen][:SEEN_GUIDS_PER_FEED]
+            marks[source_url] = (high_water, kept)
+        if marks:
+            self.mark_store.save_feed_marks(marks)
+    
+    def _dedupe(self, all_updates):
+        """Drop repeated titles within one regulator's batch"""
         seen_titles = set()
         unique_updates = []
         for update in all_updates:
@@ -58,4 +344,35 @@ class RegulatoryScraper:
                 seen_titles.add(update['title'])
                 unique_updates.append(update)
         
+        # Past the cap: left unseen so a later scan picks them up
+        with self._marks_lock:
+            self.deferred_guids.update(update.get('guid') for update in unique_updates[10:])
         return unique_updates[:10]
+    
+    def fetch_regulator_updates(self, regulator_config):
+        """Fetch all updates for a specific regulator"""
+        all_updates = []
+        
+        for kind, url in self._source_jobs(regulator_config):
+            updates = self._fetch_source(kind, url)
+            all_updates.extend(updates)
+        
+        return self._dedupe(all_updates)
+    
+    def fetch_all_updates(self, sources):
+        """Fetch every regulator's feeds and listing pages in parallel, keyed by regulator code"""
+        jobs = [
+            (regulator_code, kind, url)
+            for regulator_code, config in sources.items()
+            for kind, url in self._source_jobs(config)
+        ]
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda job: self._fetch_source(job[1], job[2]), jobs))
+        
+        # Regroup in source order so output is deterministic regardless of finish order
+        grouped = {regulator_code: [] for regulator_code in sources}
+        for (regulator_code, _, _), updates in zip(jobs, results):
+            grouped[regulator_code].extend(updates)
+        
+        return {code: self._dedupe(updates) for code, updates in grouped.items()}
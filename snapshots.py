@@ -0,0 +1,164 @@
+"""
+Snapshot-and-diff tracking of living documents (manuals, rulebooks, supervision pages)
+"""
+
+import difflib
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+from cache import DiskCache
+from documents import DOCUMENT_PROMPT_CHARS, DocumentFetcher, excerpt
+from metrics import SNAPSHOTS
+from regulatory_sources import LIVING_DOCUMENTS
+
+# A full copy is stored at least every this many snapshots of a document; in between, each
+# snapshot is a delta against the previous one
+SNAPSHOT_KEYFRAME_INTERVAL = int(os.getenv('SNAPSHOT_KEYFRAME_INTERVAL', '20'))
+# Unchanged paragraphs shown around each changed section
+DIFF_CONTEXT_PARAGRAPHS = 1
+
+
+def paragraphs(chunks):
+    """Non-empty text blocks of an extracted document, in order"""
+    return [line.strip() for chunk in chunks for line in chunk.split('\n') if line.strip()]
+
+
+def content_hash(paras):
+    return hashlib.sha256('\n'.join(paras).encode('utf-8')).hexdigest()
+
+
+def encode_delta(old, new):
+    """[start, end, replacement paragraphs] operations on old that produce new"""
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [[i1, i2, new[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_delta(old, delta):
+    result, position = [], 0
+    for start, end, replacement in delta:
+        result.extend(old[position:start])
+        result.extend(replacement)
+        position = end
+    result.extend(old[position:])
+    return result
+
+
+def changed_sections(old, new, context=DIFF_CONTEXT_PARAGRAPHS):
+    """One text block per changed region: "  " context, "- " removed and "+ " added paragraphs"""
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    sections = []
+    for group in matcher.get_grouped_opcodes(context):
+        lines = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                lines.extend(f"  {p}" for p in old[i1:i2])
+                continue
+            lines.extend(f"- {p}" for p in old[i1:i2])
+            lines.extend(f"+ {p}" for p in new[j1:j2])
+        sections.append('\n'.join(lines))
+    return sections
+
+
+def snapshot_fetcher(session=None, throttle=None):
+    """
+    DocumentFetcher for living documents: whole text, bounded only by DOCUMENT_MAX_BYTES, since a
+    character cap would cut the last paragraph mid-way and hide later changes. Its text cache is
+    kept apart from the linked-document cache, which stays capped.
+    """
+    cache = DiskCache('snapshot_documents', max_entries=max(1, len(LIVING_DOCUMENTS)) * 2,
+                      max_age=30 * 86400, autosave=False)
+    return DocumentFetcher(session=session, throttle=throttle, cache=cache, max_chars=None)
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+class SnapshotTracker:
+    """Turns changes to LIVING_DOCUMENTS pages into updates carrying only the changed sections"""
+
+    def __init__(self, store, fetcher=None, documents=None):
+        self.store = store
+        # Conditional GETs and the size and time caps come from the document stage
+        self.fetcher = fetcher if fetcher is not None else snapshot_fetcher()
+        self.documents = documents if documents is not None else LIVING_DOCUMENTS
+        self.pending = []
+
+    def _previous(self, chain):
+        """Paragraphs of the newest snapshot, rebuilt from its keyframe and deltas"""
+        paras = _unpack(chain[0]['data'])
+        for row in chain[1:]:
+            paras = apply_delta(paras, _unpack(row['data']))
+        return paras
+
+    def _check(self, url, current):
+        digest = content_hash(current)
+        chain = self.store.snapshot_chain(url)
+        if chain and chain[-1]['content_hash'] == digest:
+            SNAPSHOTS.inc(outcome='unchanged')
+            return None
+
+        full = _pack(current)
+        guid = f"{url}#rev-{digest[:12]}"
+        if not chain:
+            # Nothing to compare against yet: the first snapshot is the baseline, not a change
+            self.pending.append({'url': url, 'content_hash': digest, 'keyframe': True, 'data': full})
+            SNAPSHOTS.inc(outcome='baseline')
+            print(f"Recorded baseline snapshot of {url}")
+            return None
+
+        previous = self._previous(chain)
+        delta = _pack(encode_delta(previous, current))
+        keyframe = len(chain) >= SNAPSHOT_KEYFRAME_INTERVAL or len(delta) >= len(full)
+        self.pending.append({'url': url, 'content_hash': digest, 'keyframe': keyframe,
+                             'data': full if keyframe else delta, 'guid': guid})
+        SNAPSHOTS.inc(outcome='changed')
+
+        sections = changed_sections(previous, current)
+        added = ' '.join(line[2:] for section in sections for line in section.split('\n') if line.startswith('+ '))
+        removed = ' '.join(line[2:] for section in sections for line in section.split('\n') if line.startswith('- '))
+        now = datetime.now()
+        return {
+            # Each revision is its own update; the fragment keeps the link pointing at the page
+            'guid': guid,
+            'title': f"{self.documents[url]}: {len(sections)} section{'s' if len(sections) != 1 else ''} changed",
+            'link': guid,
+            'summary': (added or f"Removed: {removed}")[:500],
+            'date': now.strftime('%Y-%m-%d'),
+            'published': now.isoformat(),
+            'diff': excerpt([section[:DOCUMENT_PROMPT_CHARS] for section in sections], DOCUMENT_PROMPT_CHARS)
+        }
+
+    def check_all(self, sources):
+        """Updates keyed by regulator code for each tracked document that changed since its last snapshot"""
+        jobs = [
+            (regulator_code, url)
+            for regulator_code, config in sources.items()
+            for url in config.get('urls', []) if url in self.documents
+        ]
+        chunks_by_url = self.fetcher.fetch_many(url for _, url in jobs)
+
+        changes = {}
+        for regulator_code, url in jobs:
+            if url not in chunks_by_url:
+                continue
+            update = self._check(url, paragraphs(chunks_by_url[url]))
+            if update:
+                changes.setdefault(regulator_code, []).append(update)
+        return changes
+
+    def commit(self, retry=()):
+        """
+        Store the new snapshots once the scan's analyses are saved, so a failed scan diffs again.
+        Changes whose update is in retry keep their previous snapshot and are reported again.
+        """
+        unsettled = {update.get('guid') for update in retry}
+        pending, self.pending = [s for s in self.pending if s.get('guid') not in unsettled], []
+        if pending:
+            self.store.save_snapshots(pending)
@@ -0,0 +1,692 @@
+"""
+Persistent SQLite store for fetched updates, analyses and scan runs
+"""
+
+import os
+import json
+import hashlib
+import html
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join('data', 'compliance.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT NOT NULL DEFAULT 'running',
+    update_count INTEGER NOT NULL DEFAULT 0,
+    report TEXT
+);
+
+CREATE TABLE IF NOT EXISTS updates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content_key TEXT NOT NULL UNIQUE,
+    regulator TEXT NOT NULL,
+    regulation_type TEXT,
+    title TEXT NOT NULL,
+    link TEXT,
+    summary TEXT,
+    date TEXT,
+    first_seen_at TEXT NOT NULL,
+    latest_analysis_id INTEGER,
+    published_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    update_id INTEGER NOT NULL REFERENCES updates(id),
+    scan_id INTEGER NOT NULL REFERENCES scan_runs(id),
+    analysis TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    sources TEXT,
+    created_at TEXT NOT NULL,
+    error TEXT,
+    structured TEXT
+);
+
+CREATE TABLE IF NOT EXISTS analysis_categories (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id),
+    category TEXT NOT NULL,
+    PRIMARY KEY (category, analysis_id)
+);
+
+CREATE TABLE IF NOT EXISTS feed_marks (
+    feed_url TEXT PRIMARY KEY,
+    high_water TEXT,
+    seen_guids TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    trigger TEXT NOT NULL,
+    requested_at TEXT NOT NULL,
+    request_count INTEGER NOT NULL DEFAULT 1,
+    started_at TEXT,
+    finished_at TEXT,
+    scan_id INTEGER REFERENCES scan_runs(id),
+    error TEXT,
+    holder TEXT
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+-- Scan progress events, appended by the scanning process and tailed by id by every /api/stream
+CREATE TABLE IF NOT EXISTS scan_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+-- Prometheus text published by the scan leader, served by /metrics in every process
+CREATE TABLE IF NOT EXISTS published_metrics (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    body TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    regulator TEXT NOT NULL,
+    source TEXT NOT NULL,
+    window_start TEXT NOT NULL,
+    window_end TEXT NOT NULL,
+    item_count INTEGER NOT NULL,
+    completed_at TEXT NOT NULL,
+    PRIMARY KEY (regulator, source, window_start, window_end)
+);
+
+-- Living document text: a zlib-compressed JSON paragraph list when keyframe = 1, otherwise a
+-- compressed delta against the previous row for the same url (see snapshots.py)
+CREATE TABLE IF NOT EXISTS document_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    keyframe INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_document_snapshots_url ON document_snapshots(url, id);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_status ON scan_jobs(status, id);
+CREATE INDEX IF NOT EXISTS idx_updates_first_seen ON updates(first_seen_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_scan ON analyses(scan_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_update ON analyses(update_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses(created_at);
+CREATE INDEX IF NOT EXISTS idx_scan_runs_status ON scan_runs(status, finished_at);
+"""
+
+# Indexes over the publication date back the paginated dashboard query and its date filters
+QUERY_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_updates_published ON updates(published_at, id);
+CREATE INDEX IF NOT EXISTS idx_updates_regulator_published ON updates(regulator, published_at, id);
+CREATE INDEX IF NOT EXISTS idx_updates_type_published ON updates(regulation_type, published_at, id);
+"""
+
+# A running job older than this is assumed to belong to a crashed worker
+JOB_TIMEOUT_SECONDS = int(os.getenv('JOB_TIMEOUT_SECONDS', '3600'))
+
+# One full-text document per update, holding its latest analysis; rowid is updates.id
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    title, summary, analysis, regulator UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+"""
+
+# bm25 column weights: title matches outrank summary matches, which outrank analysis text
+SEARCH_RANK = "bm25(search_index, 10.0, 4.0, 1.0)"
+# Control characters mark snippet matches so the indexed text can be HTML-escaped before <mark> goes in
+SNIPPET_OPEN, SNIPPET_CLOSE = '\x02', '\x03'
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def update_key(regulator, update):
+    """Stable identity for an update: regulator plus link, falling back to title"""
+    identity = update.get('link') or update.get('title', '')
+    return hashlib.sha256(f"{regulator}\n{identity}".encode('utf-8')).hexdigest()
+
+
+def _highlight(snippet):
+    """Escape indexed text for HTML, then turn the snippet markers into <mark> tags"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SNIPPET_OPEN, '<mark>').replace(SNIPPET_CLOSE, '</mark>')
+
+
+class UpdateStore:
+    """SQLite store in WAL mode, safe to share between threads and worker processes"""
+    
+    def __init__(self, path=None):
+        self.path = path or DATABASE_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            conn.executescript(QUERY_INDEXES)
+            self.search_enabled = self._create_search_index(conn)
+    
+    def _create_search_index(self, conn):
+        """Create the FTS5 index, backfilling it from stored analyses the first time"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        ).fetchone()
+        try:
+            conn.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable (SQLite built without FTS5): {str(e)}")
+            return False
+        
+        if not exists:
+            conn.execute(
+                "INSERT INTO search_index (rowid, title, summary, analysis, regulator) "
+                "SELECT u.id, u.title, u.summary, a.analysis, u.regulator "
+                "FROM updates u JOIN analyses a ON a.id = u.latest_analysis_id"
+            )
+        return True
+    
+    def _migrate(self, conn):
+        """Bring databases created by older releases up to the current schema"""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(updates)")}
+        if 'latest_analysis_id' not in columns:
+            conn.execute("DROP INDEX IF EXISTS idx_updates_regulator")
+            conn.execute("ALTER TABLE updates ADD COLUMN latest_analysis_id INTEGER")
+            conn.execute(
+                "UPDATE updates SET latest_analysis_id = "
+                "(SELECT MAX(id) FROM analyses WHERE analyses.update_id = updates.id)"
+            )
+        if 'published_at' not in columns:
+            # The publication date of older rows is unknown; first sight is the closest stand-in
+            conn.execute("ALTER TABLE updates ADD COLUMN published_at TEXT")
+            conn.execute("UPDATE updates SET published_at = first_seen_at")
+            for index in ('idx_updates_latest', 'idx_updates_regulator', 'idx_updates_type'):
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+        
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(analyses)")}
+        if 'sources' not in columns:
+            conn.execute("ALTER TABLE analyses ADD COLUMN sources TEXT")
+        if 'error' not in columns:
+            conn.execute("ALTER TABLE analyses ADD COLUMN error TEXT")
+            conn.execute("UPDATE analyses SET error = analysis WHERE analysis LIKE 'Analysis unavailable:%'")
+        if 'structured' not in columns:
+            conn.execute("ALTER TABLE analyses ADD COLUMN structured TEXT")
+        
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(scan_runs)")}
+        if 'report' not in columns:
+            conn.execute("ALTER TABLE scan_runs ADD COLUMN report TEXT")
+        
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(scan_jobs)")}
+        if 'holder' not in columns:
+            conn.execute("ALTER TABLE scan_jobs ADD COLUMN holder TEXT")
+    
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+    
+    def start_scan(self):
+        """Record the start of a scan and return its id"""
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO scan_runs (started_at) VALUES (?)",
+                (datetime.now().isoformat(),)
+            )
+            return cursor.lastrowid
+    
+    def finish_scan(self, scan_id, analyzed_updates, status='completed', update_count=None):
+        """Persist a scan's analyzed updates and mark the run finished"""
+        self.save_analyses(scan_id, analyzed_updates)
+        if update_count is None:
+            update_count = len(analyzed_updates)
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE scan_runs SET finished_at = ?, status = ?, update_count = ? WHERE id = ?",
+                (datetime.now().isoformat(), status, update_count, scan_id)
+            )
+    
+    def save_analyses(self, scan_id, analyzed_updates):
+        """Persist analyzed updates under a scan in one transaction, without finishing the scan"""
+        if not analyzed_updates:
+            return
+        now = datetime.now().isoformat()
+        with self.connection() as conn:
+            for item in analyzed_updates:
+                update_id = self._upsert_update(conn, item, now)
+                categories = item.get('categories', [])
+                sources = item.get('sources')
+                structured = item.get('structured')
+                cursor = conn.execute(
+                    "INSERT INTO analyses (update_id, scan_id, analysis, categories, sources, created_at, error, structured) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (update_id, scan_id, item['analysis'], json.dumps(categories),
+                     json.dumps(sources) if sources else None, now, item.get('error'),
+                     json.dumps(structured) if structured else None)
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO analysis_categories (analysis_id, category) VALUES (?, ?)",
+                    [(cursor.lastrowid, category) for category in categories]
+                )
+                conn.execute(
+                    "UPDATE updates SET latest_analysis_id = ? WHERE id = ?",
+                    (cursor.lastrowid, update_id)
+                )
+                if self.search_enabled:
+                    # Incremental indexing: replace this update's document with its newest analysis
+                    conn.execute("DELETE FROM search_index WHERE rowid = ?", (update_id,))
+                    conn.execute(
+                        "INSERT INTO search_index (rowid, title, summary, analysis, regulator) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (update_id, item['update'].get('title', ''), item['update'].get('summary', ''),
+                         item['analysis'], item['regulator'])
+                    )
+    
+    def _upsert_update(self, conn, item, now):
+        update = item['update']
+        key = update_key(item['regulator'], update)
+        # ISO publication date from the source; undated entries count as published when first seen
+        published = update.get('published')
+        conn.execute(
+            "INSERT INTO updates (content_key, regulator, regulation_type, title, link, summary, date, "
+            "first_seen_at, published_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(content_key) DO UPDATE SET title = excluded.title, summary = excluded.summary, "
+            "date = excluded.date, published_at = COALESCE(?, updates.published_at)",
+            (key, item['regulator'], item.get('regulation_type'), update.get('title', ''),
+             update.get('link', ''), update.get('summary', ''), update.get('date', ''), now,
+             published or now, published)
+        )
+        return conn.execute("SELECT id FROM updates WHERE content_key = ?", (key,)).fetchone()['id']
+    
+    def analyzed_keys(self, regulator, updates):
+        """update_key()s among updates whose latest stored analysis succeeded; failed placeholders don't count"""
+        keys = [update_key(regulator, update) for update in updates]
+        if not keys:
+            return set()
+        placeholders = ', '.join('?' for _ in keys)
+        rows = self.connection().execute(
+            f"SELECT u.content_key FROM updates u JOIN analyses a ON a.id = u.latest_analysis_id "
+            f"WHERE a.error IS NULL AND u.content_key IN ({placeholders})",
+            keys
+        ).fetchall()
+        return {row['content_key'] for row in rows}
+    
+    def latest_analysis_id(self):
+        """Highest analysis id, which changes whenever any analysis is written"""
+        return self.connection().execute("SELECT MAX(id) FROM analyses").fetchone()[0] or 0
+    
+    def backfill_done(self, regulator, source, window_start, window_end):
+        """True when this backfill window was completed by an earlier run"""
+        return self.connection().execute(
+            "SELECT 1 FROM backfill_checkpoints WHERE regulator = ? AND source = ? "
+            "AND window_start = ? AND window_end = ?",
+            (regulator, source, window_start, window_end)
+        ).fetchone() is not None
+    
+    def save_backfill_checkpoint(self, regulator, source, window_start, window_end, item_count):
+        """Record a completed backfill window so a resumed run skips it"""
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO backfill_checkpoints "
+                "(regulator, source, window_start, window_end, item_count, completed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (regulator, source, window_start, window_end, item_count, datetime.now().isoformat())
+            )
+    
+    def snapshot_chain(self, url):
+        """A document's snapshots from its latest keyframe onwards, oldest first; empty if none"""
+        return self.connection().execute(
+            "SELECT id, content_hash, keyframe, data FROM document_snapshots WHERE url = ? AND id >= "
+            "(SELECT MAX(id) FROM document_snapshots WHERE url = ? AND keyframe = 1) ORDER BY id",
+            (url, url)
+        ).fetchall()
+    
+    def save_snapshots(self, snapshots):
+        """Append snapshots ({"url", "content_hash", "keyframe", "data"}) in one transaction"""
+        now = datetime.now().isoformat()
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT INTO document_snapshots (url, content_hash, keyframe, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(s['url'], s['content_hash'], int(s['keyframe']), s['data'], now) for s in snapshots]
+            )
+    
+    def get_feed_mark(self, feed_url):
+        """Return (high_water ISO timestamp or None, set of seen GUIDs) for a feed"""
+        row = self.connection().execute(
+            "SELECT high_water, seen_guids FROM feed_marks WHERE feed_url = ?", (feed_url,)
+        ).fetchone()
+        if row is None:
+            return None, set()
+        return row['high_water'], set(json.loads(row['seen_guids']))
+    
+    def save_feed_marks(self, marks):
+        """Persist {feed_url: (high_water, seen_guids)} in one transaction"""
+        now = datetime.now().isoformat()
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT INTO feed_marks (feed_url, high_water, seen_guids, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(feed_url) DO UPDATE SET high_water = excluded.high_water, "
+                "seen_guids = excluded.seen_guids, updated_at = excluded.updated_at",
+                [(url, high_water, json.dumps(list(guids)), now) for url, (high_water, guids) in marks.items()]
+            )
+    
+    def enqueue_scan(self, trigger):
+        """
+        Request a scan. Single-flight: if a scan job is already queued or running the request
+        is coalesced into it. Returns (job row, coalesced).
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = conn.execute(
+                "SELECT id FROM scan_jobs WHERE status IN ('queued', 'running') ORDER BY id LIMIT 1"
+            ).fetchone()
+            if existing:
+                conn.execute(
+                    "UPDATE scan_jobs SET request_count = request_count + 1 WHERE id = ?", (existing['id'],)
+                )
+                job_id, coalesced = existing['id'], True
+            else:
+                cursor = conn.execute(
+                    "INSERT INTO scan_jobs (trigger, requested_at) VALUES (?, ?)",
+                    (trigger, datetime.now().isoformat())
+                )
+                job_id, coalesced = cursor.lastrowid, False
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return self.get_job(job_id), coalesced
+    
+    def claim_next_job(self, holder=None):
+        """Atomically move the oldest queued job to running under holder; None if nothing is runnable"""
+        now = datetime.now()
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stale_before = datetime.fromtimestamp(now.timestamp() - JOB_TIMEOUT_SECONDS).isoformat()
+            conn.execute(
+                "UPDATE scan_jobs SET status = 'failed', finished_at = ?, error = 'worker timed out' "
+                "WHERE status = 'running' AND started_at < ?",
+                (now.isoformat(), stale_before)
+            )
+            running = conn.execute("SELECT 1 FROM scan_jobs WHERE status = 'running'").fetchone()
+            job = None
+            if running is None:
+                job = conn.execute(
+                    "SELECT id FROM scan_jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if job:
+                    conn.execute(
+                        "UPDATE scan_jobs SET status = 'running', started_at = ?, holder = ? WHERE id = ?",
+                        (now.isoformat(), holder, job['id'])
+                    )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return self.get_job(job['id']) if job else None
+    
+    def fail_orphaned_jobs(self, lease_name):
+        """
+        Fail running jobs whose holder no longer holds the named lease, so a dead leader's job
+        neither blocks the queue until JOB_TIMEOUT_SECONDS nor absorbs new scan requests
+        """
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "UPDATE scan_jobs SET status = 'failed', finished_at = ?, error = 'scan leader lost its lease' "
+                "WHERE status = 'running' AND holder IS NOT (SELECT holder FROM leases WHERE name = ?)",
+                (datetime.now().isoformat(), lease_name)
+            )
+        return cursor.rowcount
+    
+    def finish_job(self, job_id, scan_id=None, error=None):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE scan_jobs SET status = ?, finished_at = ?, scan_id = ?, error = ? WHERE id = ?",
+                ('failed' if error else 'completed', datetime.now().isoformat(), scan_id, error, job_id)
+            )
+    
+    def active_job(self):
+        """The queued or running scan job, if any"""
+        row = self.connection().execute(
+            "SELECT * FROM scan_jobs WHERE status IN ('queued', 'running') ORDER BY id LIMIT 1"
+        ).fetchone()
+        return dict(row) if row else None
+    
+    def get_job(self, job_id):
+        row = self.connection().execute("SELECT * FROM scan_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def acquire_lease(self, name, holder, ttl_seconds):
+        """
+        Take or renew the named lease for holder. Returns True while holder owns it; another
+        holder can only take it over once it has expired.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+                (name, holder, now + ttl_seconds, now)
+            )
+            row = conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return row['holder'] == holder
+    
+    def release_lease(self, name, holder):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    
+    def append_events(self, events, prune_before=None):
+        """Append (event, JSON data) pairs in order; optionally drop events created before prune_before"""
+        now = time.time()
+        with self.connection() as conn:
+            if prune_before is not None:
+                conn.execute("DELETE FROM scan_events WHERE created_at < ?", (prune_before,))
+            conn.executemany(
+                "INSERT INTO scan_events (event, data, created_at) VALUES (?, ?, ?)",
+                [(event, data, now) for event, data in events]
+            )
+    
+    def latest_event_id(self):
+        return self.connection().execute("SELECT MAX(id) FROM scan_events").fetchone()[0] or 0
+    
+    def events_after(self, event_id, limit=500):
+        """(id, event, JSON data) rows newer than event_id, oldest first"""
+        return self.connection().execute(
+            "SELECT id, event, data FROM scan_events WHERE id > ? ORDER BY id LIMIT ?", (event_id, limit)
+        ).fetchall()
+    
+    def publish_metrics(self, name, holder, body):
+        """Replace the metrics text published under name"""
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO published_metrics (name, holder, body, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, body = excluded.body, "
+                "updated_at = excluded.updated_at",
+                (name, holder, body, time.time())
+            )
+    
+    def published_metrics(self, name):
+        """(holder, body, updated_at) of the metrics published under name, or None"""
+        row = self.connection().execute(
+            "SELECT holder, body, updated_at FROM published_metrics WHERE name = ?", (name,)
+        ).fetchone()
+        return (row['holder'], row['body'], row['updated_at']) if row else None
+    
+    def save_scan_report(self, scan_id, report):
+        """Attach a scan's timing and metrics report"""
+        with self.connection() as conn:
+            conn.execute("UPDATE scan_runs SET report = ? WHERE id = ?", (json.dumps(report), scan_id))
+    
+    def get_scan(self, scan_id):
+        """A scan run with its decoded report, or None"""
+        row = self.connection().execute("SELECT * FROM scan_runs WHERE id = ?", (scan_id,)).fetchone()
+        if row is None:
+            return None
+        scan = dict(row)
+        scan['report'] = json.loads(scan['report']) if scan['report'] else None
+        return scan
+    
+    def last_scan(self):
+        """Most recent completed scan run, or None"""
+        return self.connection().execute(
+            "SELECT * FROM scan_runs WHERE status = 'completed' ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    
+    def latest_results(self):
+        """Analyzed updates from the most recent completed scan, in analysis order"""
+        scan = self.last_scan()
+        if scan is None:
+            return []
+        
+        rows = self.connection().execute(
+            "SELECT a.analysis, a.categories, a.sources, a.structured, u.regulator, u.regulation_type, "
+            "u.title, u.link, u.summary, u.date "
+            "FROM analyses a JOIN updates u ON u.id = a.update_id "
+            "WHERE a.scan_id = ? ORDER BY a.id",
+            (scan['id'],)
+        ).fetchall()
+        return [self._row_to_result(row) for row in rows]
+    
+    def query_updates(self, regulator=None, category=None, regulation_type=None, since=None,
+                      until=None, cursor=None, limit=DEFAULT_PAGE_SIZE, include_analysis=True):
+        """
+        Page through the latest analysis of every stored update, most recently published first.
+        since and until are ISO dates or timestamps compared with the publication date.
+        
+        cursor is the next_cursor returned by the previous page. Returns (results, next_cursor),
+        where next_cursor is None on the last page. Raises ValueError for a malformed cursor.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        analysis_column = "a.analysis, a.structured" if include_analysis else "NULL AS analysis"
+        sql = (
+            f"SELECT u.id AS update_id, a.id AS analysis_id, {analysis_column}, a.categories, a.sources, "
+            "u.regulator, u.regulation_type, u.title, u.link, u.summary, u.date, u.first_seen_at, u.published_at "
+            "FROM updates u JOIN analyses a ON a.id = u.latest_analysis_id "
+        )
+        clauses = ["u.latest_analysis_id IS NOT NULL"]
+        params = []
+        
+        if category:
+            sql += "JOIN analysis_categories c ON c.analysis_id = a.id AND c.category = ? "
+            params.append(category)
+        if regulator:
+            clauses.append("u.regulator = ?")
+            params.append(regulator)
+        if regulation_type:
+            # Regulators covering both traditional and digital assets match either filter
+            clauses.append("u.regulation_type IN (?, 'both')")
+            params.append(regulation_type)
+        if since:
+            clauses.append("u.published_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("u.published_at < ?")
+            params.append(until)
+        if cursor:
+            # "<published_at>|<update id>" of the previous page's last row
+            published_at, _, update_id = cursor.rpartition('|')
+            if not published_at or not update_id.isdigit():
+                raise ValueError(f"invalid cursor {cursor!r}")
+            clauses.append("(u.published_at < ? OR (u.published_at = ? AND u.id < ?))")
+            params += [published_at, published_at, int(update_id)]
+        
+        sql += "WHERE " + " AND ".join(clauses) + " ORDER BY u.published_at DESC, u.id DESC LIMIT ?"
+        # Fetch one extra row to learn whether another page exists without a COUNT(*)
+        params.append(limit + 1)
+        
+        rows = self.connection().execute(sql, params).fetchall()
+        last = rows[limit - 1] if len(rows) > limit else None
+        next_cursor = f"{last['published_at']}|{last['update_id']}" if last else None
+        return [self._row_to_result(row) for row in rows[:limit]], next_cursor
+    
+    def search(self, query, regulator=None, limit=DEFAULT_PAGE_SIZE, offset=0):
+        """
+        Ranked full-text search over titles, summaries and analyses using FTS5 query syntax
+        ("exact phrases", AND/OR/NOT, prefix*). Raises sqlite3.OperationalError on invalid syntax.
+        Returns (results, has_more).
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        sql = (
+            "SELECT u.id AS update_id, a.id AS analysis_id, NULL AS analysis, a.categories, a.sources, "
+            "u.regulator, u.regulation_type, u.title, u.link, u.summary, u.date, u.first_seen_at, "
+            f"{SEARCH_RANK} AS rank, "
+            "snippet(search_index, -1, ?, ?, '...', 16) AS snippet "
+            "FROM search_index JOIN updates u ON u.id = search_index.rowid "
+            "JOIN analyses a ON a.id = u.latest_analysis_id "
+            "WHERE search_index MATCH ? "
+        )
+        params = [SNIPPET_OPEN, SNIPPET_CLOSE, query]
+        if regulator:
+            sql += "AND u.regulator = ? "
+            params.append(regulator)
+        sql += "ORDER BY rank LIMIT ? OFFSET ?"
+        params += [limit + 1, max(0, int(offset))]
+        
+        rows = self.connection().execute(sql, params).fetchall()
+        results = []
+        for row in rows[:limit]:
+            result = self._row_to_result(row)
+            result['snippet'] = _highlight(row['snippet'])
+            result['score'] = -row['rank']
+            results.append(result)
+        return results, len(rows) > limit
+    
+    def get_update(self, update_id):
+        """Latest analyzed result for a single update, or None"""
+        row = self.connection().execute(
+            "SELECT u.id AS update_id, a.id AS analysis_id, a.analysis, a.structured, a.categories, a.sources, "
+            "u.regulator, u.regulation_type, u.title, u.link, u.summary, u.date, u.first_seen_at, u.published_at "
+            "FROM updates u JOIN analyses a ON a.id = u.latest_analysis_id WHERE u.id = ?",
+            (update_id,)
+        ).fetchone()
+        return self._row_to_result(row) if row else None
+    
+    def _row_to_result(self, row):
+        """Shape a row like ComplianceAnalyzer.analyze_update output"""
+        result = {
+            'update': {
+                'title': row['title'],
+                'link': row['link'],
+                'summary': row['summary'],
+                'date': row['date']
+            },
+            'analysis': row['analysis'],
+            'regulator': row['regulator'],
+            'regulation_type': row['regulation_type'],
+            'categories': json.loads(row['categories']),
+            'sources': json.loads(row['sources']) if row['sources'] else []
+        }
+        # Summary, compliance areas, impacts and recommendations as the model returned them (batched analyses)
+        if 'structured' in row.keys() and row['structured']:
+            result['structured'] = json.loads(row['structured'])
+        if 'update_id' in row.keys():
+            result['id'] = row['update_id']
+            result['first_seen_at'] = row['first_seen_at']
+            if 'published_at' in row.keys():
+                result['published_at'] = row['published_at']
+            if row['analysis'] is None:
+                del result['analysis']
+        return result
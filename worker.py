@@ -0,0 +1,107 @@
+"""
+Scan worker: runs queued scan jobs one at a time and enqueues the daily scheduled scan.
+
+Runs inside the web process by default (see gunicorn_config.py) or standalone with
+`python worker.py`, so web workers scale independently of the scan workload.
+"""
+
+import os
+import socket
+import threading
+import time
+import schedule
+from app import results_are_stale, run_daily_scan, store
+from metrics import REGISTRY
+
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '5'))
+# Only the holder of this lease runs scans and the schedule; others stand by to take over
+LEADER_LEASE_NAME = 'scan-leader'
+LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', '60'))
+
+
+def publish_metrics(holder):
+    """Share this process's metrics through the store, so /metrics in any process shows the leader's"""
+    try:
+        store.publish_metrics(LEADER_LEASE_NAME, holder, REGISTRY.render())
+    except Exception as e:
+        print(f"✗ Publishing metrics failed: {str(e)}")
+
+
+def run_pending_jobs(leadership=None, holder=None):
+    """Run queued scan jobs, recorded as held by holder, until the queue is empty or leadership is lost"""
+    while True:
+        if leadership is not None and not leadership.is_set():
+            return
+        job = store.claim_next_job(holder)
+        if job is None:
+            return
+        
+        print(f"Running scan job {job['id']} (trigger: {job['trigger']}, requests: {job['request_count']})")
+        try:
+            scan_id = run_daily_scan()
+        except Exception as e:
+            print(f"✗ Scan job {job['id']} failed: {str(e)}")
+            store.finish_job(job['id'], error=str(e))
+        else:
+            store.finish_job(job['id'], scan_id=scan_id)
+        if holder is not None:
+            publish_metrics(holder)
+
+
+def hold_leader_lease(holder, leadership):
+    """Keep trying to take or renew the leader lease, mirroring ownership in the leadership event"""
+    while True:
+        try:
+            leader_now = store.acquire_lease(LEADER_LEASE_NAME, holder, LEADER_LEASE_SECONDS)
+        except Exception as e:
+            print(f"✗ Lease renewal failed: {str(e)}")
+            leader_now = False
+        
+        if leader_now != leadership.is_set():
+            print(f"Scan worker {holder}: {'acquired' if leader_now else 'lost'} leader lease")
+            if leader_now:
+                # Jobs a previous leader left running will never finish; free the queue for this one
+                try:
+                    failed = store.fail_orphaned_jobs(LEADER_LEASE_NAME)
+                except Exception as e:
+                    print(f"✗ Could not clear the previous leader's jobs: {str(e)}")
+                    failed = 0
+                if failed:
+                    print(f"Failed {failed} scan job(s) left running by the previous leader")
+                leadership.set()
+            else:
+                leadership.clear()
+        if leader_now:
+            # Also refreshes scan metrics mid-scan
+            publish_metrics(holder)
+        # Renew well before expiry, including while a long scan is running
+        time.sleep(LEADER_LEASE_SECONDS / 3)
+
+
+def work_forever():
+    """
+    Poll the job queue and enqueue daily scans at 8 AM EST (13:00 UTC) while holding the
+    leader lease, so exactly one process scans however many web workers are running.
+    """
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    leadership = threading.Event()
+    threading.Thread(target=hold_leader_lease, args=(holder, leadership), daemon=True).start()
+    
+    schedule.every().day.at("13:00").do(store.enqueue_scan, 'schedule')
+    
+    startup_checked = False
+    while True:
+        if leadership.is_set():
+            # Web workers boot from stored results; the leader scans once if they are missing or stale
+            if not startup_checked:
+                startup_checked = True
+                if results_are_stale():
+                    store.enqueue_scan('startup')
+            schedule.run_pending()
+            run_pending_jobs(leadership, holder)
+        time.sleep(JOB_POLL_SECONDS)
+
+
+if __name__ == '__main__':
+    print("Scan worker started")
+    work_forever()